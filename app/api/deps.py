@@ -3,13 +3,15 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
 from app.core.security import verify_password
+from app.db.async_session import get_async_db
 from app.db.session import SessionLocal
 from app.models.user import User
 from app.schemas.token import TokenPayload
+from app.services.user_cache import UserPrincipal, user_cache
 
 settings = get_settings()
 
@@ -24,10 +26,10 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(reusable_oauth2)
-) -> User:
+) -> UserPrincipal:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=["HS256"]
@@ -38,25 +40,31 @@ def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = db.query(User).get(token_data.sub)
+    # Most requests are served from the principal cache without a DB hit
+    principal = await user_cache.get(token_data.sub)
+    if principal is not None:
+        return principal
+    user = await db.get(User, token_data.sub)
     if not user:
         raise HTTPException(
             status_code=404, detail="User not found"
         )
-    return user
+    principal = UserPrincipal.from_user(user)
+    await user_cache.set(principal)
+    return principal
 
-def get_current_active_user(
-    current_user: User = Depends(get_current_user),
-) -> User:
+async def get_current_active_user(
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> UserPrincipal:
     if not current_user.is_active:
         raise HTTPException(
             status_code=400, detail="Inactive user"
         )
     return current_user
 
-def get_current_active_superuser(
-    current_user: User = Depends(get_current_user),
-) -> User:
+async def get_current_active_superuser(
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
@@ -1,109 +1,262 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Any, List, Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import crud, models, schemas
+from app import crud, schemas
 from app.api import deps
+from app.core.config import get_settings
+from app.db.redis import get_redis, get_sync_redis
 from app.models.task import TaskStatus
+from app.services.cron import CronSchedule
+from app.services.deduplicator import Deduplicator
+from app.services.result_store import get_result_store
+from app.services.result_export import csv_lines, gzip_stream, ndjson_lines
+from app.services.user_cache import UserPrincipal
+from app.tasks.dispatch import DispatchError, dispatch_tasks
 
 router = APIRouter()
+settings = get_settings()
+cron_schedule = CronSchedule(get_sync_redis())
+deduplicator = Deduplicator(get_redis())
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
+
+async def enqueue_tasks(db: AsyncSession, rows) -> None:
+    """Send queued tasks to Celery, returning those not sent to PENDING on failure"""
+    try:
+        await run_in_threadpool(dispatch_tasks, rows)
+    except DispatchError as e:
+        sent = set(e.sent_ids)
+        await crud.task_async.release_tasks(
+            db, task_ids=[row.id for row in rows if row.id not in sent]
+        )
+        raise HTTPException(status_code=503, detail="Task queue unavailable")
 
 @router.get("/", response_model=List[schemas.Task])
-def read_tasks(
-    db: Session = Depends(deps.get_db),
+async def read_tasks(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_db),
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    after_id: Optional[int] = None,
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Retrieve tasks.
+
+    Pass the ``X-Next-Cursor`` header of a page as ``after_id`` to fetch the
+    next one without OFFSET.
     """
     if crud.user.is_superuser(current_user):
-        tasks = crud.task.get_multi(db, skip=skip, limit=limit)
+        tasks = await crud.task_async.get_multi(
+            db, skip=skip, limit=limit, after_id=after_id
+        )
     else:
-        tasks = crud.task.get_user_tasks(
-            db, user_id=current_user.id, skip=skip, limit=limit
+        tasks = await crud.task_async.get_user_tasks(
+            db, user_id=current_user.id, skip=skip, limit=limit, after_id=after_id
         )
+    if len(tasks) == limit:
+        response.headers["X-Next-Cursor"] = str(tasks[-1].id)
     return tasks
 
 @router.post("/", response_model=schemas.Task)
-def create_task(
+async def create_task(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     task_in: schemas.TaskCreate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Create new task.
     """
-    task = crud.task.create(db, obj_in=task_in)
+    task = await crud.task_async.create(db, obj_in=task_in)
+    await run_in_threadpool(cron_schedule.add, task.id, task.next_run)
     return task
 
+@router.post("/bulk", response_model=schemas.TaskIds)
+async def create_tasks_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    tasks_in: schemas.TaskBulkCreate,
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Create many tasks with a single insert.
+    """
+    if len(tasks_in.tasks) > settings.BULK_MAX_TASKS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BULK_MAX_TASKS} tasks per request"
+        )
+    created = await crud.task_async.create_many(
+        db, objs_in=tasks_in.tasks, user_id=current_user.id
+    )
+    scheduled = [(row.id, row.next_run) for row in created if row.next_run]
+    if scheduled:
+        await run_in_threadpool(cron_schedule.sync, scheduled)
+    return {"ids": [row.id for row in created]}
+
+@router.post("/bulk/start", response_model=schemas.TaskBulkStartResult)
+async def start_tasks_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    tasks_in: schemas.TaskBulkStart,
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Queue many pending tasks at once.
+    """
+    if len(tasks_in.task_ids) > settings.BULK_MAX_TASKS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BULK_MAX_TASKS} tasks per request"
+        )
+    rows = await crud.task_async.queue_tasks(
+        db,
+        task_ids=tasks_in.task_ids,
+        user_id=None if crud.user.is_superuser(current_user) else current_user.id
+    )
+    if rows:
+        await enqueue_tasks(db, rows)
+    started = {row.id for row in rows}
+    return {
+        "started": [task_id for task_id in tasks_in.task_ids if task_id in started],
+        "skipped": [task_id for task_id in tasks_in.task_ids if task_id not in started],
+    }
+
+@router.get("/results/export")
+def export_results(
+    *,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    task_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    compress: bool = True,
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Stream stored results as NDJSON or CSV, gzip-compressed by default.
+
+    Results are read from the result store in chunks and encoded as they are
+    sent, so the export size is not bounded by API memory. Only superusers
+    may export results of other users.
+    """
+    if not crud.user.is_superuser(current_user):
+        user_id = current_user.id
+    encode, media_type = EXPORT_FORMATS[fmt]
+
+    chunks = get_result_store().iter_results(
+        task_id=task_id,
+        user_id=user_id,
+        since=since,
+        until=until,
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    body = encode(chunks)
+    headers = {"Content-Disposition": f'attachment; filename="task-results.{fmt}"'}
+    if compress:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    # A sync iterator is consumed in Starlette's threadpool, off the event loop
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
 @router.put("/{task_id}", response_model=schemas.Task)
-def update_task(
+async def update_task(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     task_id: int,
     task_in: schemas.TaskUpdate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Update task.
     """
-    task = crud.task.get(db, id=task_id)
+    task = await crud.task_async.get(db, id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if not crud.user.is_superuser(current_user) and task.user_id != current_user.id:
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    task = crud.task.update(db, db_obj=task, obj_in=task_in)
+    task = await crud.task_async.update(db, db_obj=task, obj_in=task_in)
+    await run_in_threadpool(cron_schedule.add, task.id, task.next_run)
     return task
 
 @router.get("/{task_id}", response_model=schemas.Task)
-def read_task(
+async def read_task(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     task_id: int,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Get task by ID.
     """
-    task = crud.task.get(db, id=task_id)
+    task = await crud.task_async.get(db, id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if not crud.user.is_superuser(current_user) and task.user_id != current_user.id:
         raise HTTPException(status_code=400, detail="Not enough permissions")
     return task
 
+@router.get("/{task_id}/result", response_model=List[schemas.TaskResult])
+async def read_task_result(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    task_id: int,
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get the task's current results: those stored by its latest run, or, for
+    batch tasks, the latest result stored for each URL.
+    """
+    task = await crud.task_async.get(db, id=task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not crud.user.is_superuser(current_user) and task.user_id != current_user.id:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    if not task.result_ref:
+        return []
+    if (task.config or {}).get("urls"):
+        return await run_in_threadpool(get_result_store().get_latest, task.id)
+    return await run_in_threadpool(get_result_store().get_run, task.result_ref)
+
 @router.delete("/{task_id}", response_model=schemas.Task)
-def delete_task(
+async def delete_task(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     task_id: int,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Delete task.
     """
-    task = crud.task.get(db, id=task_id)
+    task = await crud.task_async.get(db, id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if not crud.user.is_superuser(current_user) and task.user_id != current_user.id:
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    task = crud.task.remove(db, id=task_id)
+    task = await crud.task_async.remove(db, id=task_id)
+    await run_in_threadpool(cron_schedule.remove, task_id)
+    await deduplicator.forget(str(task_id))
     return task
 
 @router.post("/{task_id}/start", response_model=schemas.Task)
-def start_task(
+async def start_task(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     task_id: int,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: UserPrincipal = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Start a task.
     """
-    task = crud.task.get(db, id=task_id)
+    task = await crud.task_async.get(db, id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if not crud.user.is_superuser(current_user) and task.user_id != current_user.id:
@@ -111,6 +264,9 @@ def start_task(
     if task.status != TaskStatus.PENDING:
         raise HTTPException(status_code=400, detail="Task is not in pending status")
     
-    # TODO: Add task to Celery queue
-    task = crud.task.update_task_status(db, task_id=task_id, status=TaskStatus.RUNNING)
+    rows = await crud.task_async.queue_tasks(db, task_ids=[task_id])
+    if not rows:
+        raise HTTPException(status_code=409, detail="Task status changed concurrently")
+    await enqueue_tasks(db, rows)
+    await db.refresh(task)
     return task
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Web Scraper System"
@@ -9,22 +9,100 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # derived from DATABASE_URL if unset
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800  # 30 minutes
+    
+    # Result storage
+    RESULT_STORE_BACKEND: str = "sql"  # sql, mongo
+    MONGO_URL: Optional[str] = None
+    MONGO_DATABASE: str = "web_scraper"
+    EXPORT_CHUNK_SIZE: int = 1000
     
     # Redis
     REDIS_URL: str
+    COOKIE_CACHE_TTL: float = 5.0  # seconds, in-process cache of Redis cookies
+    COOKIE_CACHE_SIZE: int = 1024
     
     # Security
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
+    USER_CACHE_TTL: int = 30  # seconds
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_REDIS: bool = False
     
     # Proxy settings
     PROXY_CHECK_INTERVAL: int = 300  # 5 minutes
     MAX_PROXY_FAILURES: int = 3
+    PROXY_COOLDOWN: float = 30.0  # seconds, doubled per consecutive failure
+    PROXY_MAX_COOLDOWN: float = 600.0
+    PROXY_LATENCY_EWMA_ALPHA: float = 0.3
+    PROXY_CHECK_URL: str = "http://httpbin.org/ip"
+    PROXY_CHECK_TIMEOUT: int = 10
+    PROXY_CHECK_CONCURRENCY: int = 100
     
     # Task settings
-    DEFAULT_TASK_TIMEOUT: int = 300  # 5 minutes
+    DEFAULT_TASK_TIMEOUT: int = 300  # 5 minutes, end-to-end deadline of one run
     MAX_RETRIES: int = 3
+    RETRY_BACKOFF: float = 10.0  # seconds, base delay of task retries
+    RETRY_MAX_BACKOFF: float = 600.0
     CONCURRENT_TASKS: int = 5
+    SCHEDULER_INTERVAL: int = 10  # seconds
+    SCHEDULER_BATCH_SIZE: int = 500
+    SCHEDULER_USER_SHARE: int = 200  # per-user tasks per scheduler run while others are waiting
+    WORKER_POOL: str = "prefork"  # "threads" runs many tasks per process on one event loop
+    WORKER_MAX_IN_FLIGHT: int = 100  # concurrent scraping coroutines per worker process
+    QUEUE_CONCURRENCY: Dict[str, int] = {"high": 8, "medium": 4, "low": 2}
+    QUEUE_PREFETCH: Dict[str, int] = {"high": 1, "medium": 1, "low": 4}
+    BULK_MAX_TASKS: int = 50000
+    
+    # HTTP client settings
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 10
+    HTTP_DNS_CACHE_TTL: int = 300  # 5 minutes
+    HTTP_KEEPALIVE_TIMEOUT: float = 30.0
+    FETCH_MAX_BYTES: int = 10 * 1024 * 1024  # 10 MB
+    FETCH_CHUNK_SIZE: int = 64 * 1024
+    FETCH_CONNECT_TIMEOUT: float = 10.0  # seconds, per attempt
+    FETCH_SOCK_READ_TIMEOUT: float = 15.0  # seconds between reads, cuts off slow-drip servers
+    FETCH_TOTAL_TIMEOUT: float = 30.0  # seconds, per attempt
+    FETCH_RETRIES: int = 2  # quick in-process retries of transient fetch failures
+    FETCH_RETRY_BACKOFF: float = 0.5
+    FETCH_RETRY_MAX_BACKOFF: float = 5.0
+    
+    # Per-domain rate limit settings
+    RATE_LIMIT_ENABLED: bool = True
+    DOMAIN_RATE_LIMIT: float = 2.0  # requests per second, shared by all workers
+    DOMAIN_BURST: int = 5
+    DOMAIN_MAX_CONCURRENCY: int = 4  # per worker process
+    RATE_LIMIT_LEASE_SIZE: int = 2
+    RATE_LIMIT_BACKOFF: float = 5.0  # seconds, doubled per consecutive 429/503
+    RATE_LIMIT_MAX_BACKOFF: float = 300.0
+    RATE_LIMIT_MIN_FACTOR: float = 0.1
+    RATE_LIMIT_MAX_DOMAINS: int = 10000  # idle domains remembered per worker
+    
+    # Per-host circuit breaker settings
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive failures before opening
+    CIRCUIT_FAILURE_WINDOW: float = 60.0  # seconds
+    CIRCUIT_OPEN_TIME: float = 30.0  # seconds, doubled per failed probe
+    CIRCUIT_MAX_OPEN_TIME: float = 600.0
+    CIRCUIT_CACHE_TTL: float = 1.0  # seconds a closed verdict is trusted locally
+    CIRCUIT_MAX_HOSTS: int = 10000  # hosts whose verdict is cached per worker
+    
+    # HTTP cache settings
+    HTTP_CACHE_ENABLED: bool = True
+    HTTP_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # 512 MB
+    HTTP_CACHE_MAX_BODY_BYTES: int = 1024 * 1024  # 1 MB
+    DEDUP_TTL: int = 7 * 24 * 3600  # seconds a result fingerprint is remembered
+    
+    # Parser settings
+    PARSER_EXECUTOR: str = "thread"  # thread, process, none
+    PARSER_WORKERS: Optional[int] = None  # None = executor default
+    DEFAULT_PARSER: str = "html.parser"  # html.parser, lxml, selectolax
+    SELECTOR_PLAN_CACHE_SIZE: int = 256
     
     class Config:
         env_file = ".env"
@@ -20,9 +20,19 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[Any] = None
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        """List rows ordered by id. Pass the last seen id as ``after_id`` for
+        keyset pagination; ``skip`` is kept for OFFSET-style callers."""
+        query = db.query(self.model).order_by(self.model.id)
+        if after_id is not None:
+            query = query.filter(self.model.id > after_id)
+        return query.offset(skip).limit(limit).all()
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
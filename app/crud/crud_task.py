@@ -1,46 +1,253 @@
-from typing import List, Optional
+from typing import Any, Collection, Dict, List, Optional, Sequence, Tuple, Union
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 from datetime import datetime
 
+from app.crud.async_base import AsyncCRUDBase
 from app.crud.base import CRUDBase
-from app.models.task import Task, TaskStatus
+from app.models.task import Task, TaskPriority, TaskStatus
 from app.schemas.task import TaskCreate, TaskUpdate
+from app.services.cron import next_run_for
+
+# Recurring tasks fire again from these states once next_run comes due
+RESCHEDULABLE_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+# Target status -> states it may be entered from
+ALLOWED_TRANSITIONS = {
+    TaskStatus.PENDING: (TaskStatus.QUEUED, TaskStatus.COMPLETED,
+                         TaskStatus.FAILED, TaskStatus.CANCELLED),
+    # RUNNING -> QUEUED is a retry handed back to Celery
+    TaskStatus.QUEUED: (TaskStatus.PENDING, TaskStatus.RUNNING) + RESCHEDULABLE_STATUSES,
+    TaskStatus.RUNNING: (TaskStatus.PENDING, TaskStatus.QUEUED),
+    TaskStatus.COMPLETED: (TaskStatus.RUNNING,),
+    TaskStatus.FAILED: (TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING),
+    TaskStatus.CANCELLED: (TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING),
+}
+
+STATUS_RETURNING = (Task.id, Task.status, Task.next_run, Task.retry_count, Task.schedule)
+# What dispatch_tasks needs to route a queued task
+DISPATCH_RETURNING = (Task.id, Task.priority, Task.user_id, Task.config)
+
+# Ids bound per statement; drivers cap the number of bind parameters
+# (asyncpg at 32767), so long id lists are split across statements
+ID_CHUNK_SIZE = 10000
+
+def _id_chunks(task_ids: List[int]) -> List[List[int]]:
+    return [task_ids[i:i + ID_CHUNK_SIZE] for i in range(0, len(task_ids), ID_CHUNK_SIZE)]
+
+def _with_next_run(obj_in: Union[TaskUpdate, Dict[str, Any]]) -> Dict[str, Any]:
+    """Update data with next_run recomputed when the schedule changes"""
+    if isinstance(obj_in, dict):
+        update_data = obj_in
+    else:
+        update_data = obj_in.dict(exclude_unset=True)
+    if "schedule" in update_data and "next_run" not in update_data:
+        update_data = {
+            **update_data, "next_run": next_run_for(update_data["schedule"])
+        }
+    return update_data
+
+def _user_tasks_query(user_id: int, after_id: Optional[int]) -> Select:
+    query = select(Task).where(Task.user_id == user_id).order_by(Task.id)
+    if after_id is not None:
+        query = query.where(Task.id > after_id)
+    return query
+
+def _status_values(
+    status: TaskStatus,
+    error_message: Optional[str],
+    result_ref: Optional[str],
+    schedule: Optional[str]
+) -> Dict[str, Any]:
+    values: Dict[str, Any] = {"status": status}
+    if status in (TaskStatus.FAILED, TaskStatus.QUEUED) and error_message:
+        values["error_message"] = error_message
+        values["retry_count"] = Task.retry_count + 1
+        
+    if status == TaskStatus.COMPLETED:
+        values["last_run"] = datetime.utcnow()
+        if result_ref is not None:
+            values["result_ref"] = result_ref
+
+    # Advance recurring tasks in the same commit as the status change
+    if status in RESCHEDULABLE_STATUSES and schedule:
+        values["next_run"] = next_run_for(schedule)
+    return values
+
+def _status_update(task_id: int, values: Dict[str, Any],
+                   from_status: Optional[Sequence[TaskStatus]] = None):
+    stmt = update(Task).where(Task.id == task_id)
+    if from_status is not None:
+        stmt = stmt.where(Task.status.in_(from_status))
+    return stmt.values(**values).returning(*STATUS_RETURNING)
 
 class CRUDTask(CRUDBase[Task, TaskCreate, TaskUpdate]):
+    def create(self, db: Session, *, obj_in: TaskCreate) -> Task:
+        obj_in_data = jsonable_encoder(obj_in)
+        obj_in_data["next_run"] = next_run_for(obj_in_data.get("schedule"))
+        db_obj = self.model(**obj_in_data)
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def update(
+        self,
+        db: Session,
+        *,
+        db_obj: Task,
+        obj_in: Union[TaskUpdate, Dict[str, Any]]
+    ) -> Task:
+        return super().update(db, db_obj=db_obj, obj_in=_with_next_run(obj_in))
+
     def get_by_status(
-        self, db: Session, *, status: TaskStatus, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        status: TaskStatus,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None
     ) -> List[Task]:
-        return (
+        query = (
             db.query(self.model)
             .filter(Task.status == status)
-            .offset(skip)
-            .limit(limit)
-            .all()
+            .order_by(Task.id)
         )
+        if after_id is not None:
+            query = query.filter(Task.id > after_id)
+        return query.offset(skip).limit(limit).all()
 
     def get_pending_tasks(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        after: Optional[Tuple[TaskPriority, int]] = None
     ) -> List[Task]:
-        return (
+        """Due pending tasks, highest priority first. ``after`` is the
+        (priority, id) of the last task of the previous page."""
+        query = (
             db.query(self.model)
             .filter(Task.status == TaskStatus.PENDING)
             .filter(Task.next_run <= datetime.utcnow())
-            .order_by(Task.priority.desc())
-            .offset(skip)
+            .order_by(Task.priority.desc(), Task.id)
+        )
+        if after is not None:
+            priority, last_id = after
+            query = query.filter(or_(
+                Task.priority < priority,
+                and_(Task.priority == priority, Task.id > last_id),
+            ))
+        return query.offset(skip).limit(limit).all()
+
+    def claim_due_tasks(
+        self,
+        db: Session,
+        *,
+        task_ids: Optional[List[int]] = None,
+        after_id: int = 0,
+        limit: int = 500,
+        exclude_users: Optional[Collection[int]] = None
+    ) -> Sequence[Row]:
+        """Atomically move due tasks to QUEUED and return them.
+
+        Due tasks are pending ones plus recurring ones that finished their
+        last run. Rows locked by a concurrent scheduler are skipped rather
+        than waited on, so overlapping runs never claim the same task.
+        Candidates come from ``task_ids`` when given, otherwise the table is
+        paged by ``id`` (keyset) starting after ``after_id``. Tasks of
+        ``exclude_users`` are left alone.
+        """
+        due = (
+            select(Task.id)
+            .where(or_(
+                Task.status == TaskStatus.PENDING,
+                and_(Task.schedule.isnot(None),
+                     Task.status.in_(RESCHEDULABLE_STATUSES)),
+            ))
+            .where(Task.next_run <= datetime.utcnow())
+            .order_by(Task.id)
             .limit(limit)
-            .all()
+            .with_for_update(skip_locked=True)
         )
+        if task_ids is not None:
+            due = due.where(Task.id.in_(task_ids))
+        else:
+            due = due.where(Task.id > after_id)
+        if exclude_users:
+            due = due.where(Task.user_id.notin_(exclude_users))
+        rows = db.execute(
+            update(Task)
+            .where(Task.id.in_(due.scalar_subquery()))
+            .values(status=TaskStatus.QUEUED)
+            .returning(*DISPATCH_RETURNING)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return rows
+
+    def filter_user_tasks(
+        self, db: Session, *, task_ids: List[int], user_ids: Collection[int]
+    ) -> List[int]:
+        """The ids among ``task_ids`` owned by ``user_ids``"""
+        return list(db.scalars(
+            select(Task.id)
+            .where(Task.id.in_(task_ids))
+            .where(Task.user_id.in_(user_ids))
+        ))
+
+    def has_queued_tasks(
+        self, db: Session, *, exclude_users: Optional[Collection[int]] = None
+    ) -> bool:
+        """Whether any task, other than those of ``exclude_users``, is
+        waiting in the Celery queues"""
+        queued = select(Task.id).where(Task.status == TaskStatus.QUEUED)
+        if exclude_users:
+            queued = queued.where(Task.user_id.notin_(exclude_users))
+        return db.execute(queued.limit(1)).first() is not None
+
+    def get_scheduled(
+        self, db: Session, *, after_id: int = 0, limit: int = 1000
+    ) -> Sequence[Row]:
+        """(id, next_run) of tasks waiting to fire, paged by id"""
+        return db.execute(
+            select(Task.id, Task.next_run)
+            .where(Task.next_run.isnot(None))
+            .where(Task.status != TaskStatus.CANCELLED)
+            .where(Task.id > after_id)
+            .order_by(Task.id)
+            .limit(limit)
+        ).all()
+
+    def release_tasks(self, db: Session, *, task_ids: List[int]) -> None:
+        """Return claimed tasks to PENDING, e.g. when dispatch failed"""
+        for chunk in _id_chunks(task_ids):
+            db.execute(
+                update(Task)
+                .where(Task.id.in_(chunk))
+                .where(Task.status == TaskStatus.QUEUED)
+                .values(status=TaskStatus.PENDING)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
 
     def get_user_tasks(
-        self, db: Session, *, user_id: int, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None
     ) -> List[Task]:
-        return (
-            db.query(self.model)
-            .filter(Task.user_id == user_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        query = _user_tasks_query(user_id, after_id).offset(skip).limit(limit)
+        return list(db.scalars(query))
 
     def update_task_status(
         self, 
@@ -48,20 +255,149 @@ class CRUDTask(CRUDBase[Task, TaskCreate, TaskUpdate]):
         *,
         task_id: int,
         status: TaskStatus,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        result_ref: Optional[str] = None,
+        from_status: Optional[Sequence[TaskStatus]] = None,
+        schedule: Optional[str] = None
+    ) -> Optional[Row]:
+        """Move a task to ``status`` with a single conditional UPDATE.
+
+        The update only applies while the task is in one of ``from_status``
+        (by default the states allowed by ``ALLOWED_TRANSITIONS``), so a
+        concurrent transition wins cleanly; None is returned when the task
+        is missing or in another state. Returns (id, status, next_run,
+        retry_count, schedule). Pass the task's ``schedule`` when known so
+        recurring tasks get their next_run in the same statement.
+        """
+        if from_status is None:
+            from_status = ALLOWED_TRANSITIONS[status]
+        values = _status_values(status, error_message, result_ref, schedule)
+        row = db.execute(_status_update(task_id, values, from_status)).first()
+        if row is None:
+            db.rollback()
+            return None
+
+        if status in RESCHEDULABLE_STATUSES and row.schedule and "next_run" not in values:
+            row = db.execute(
+                _status_update(task_id, {"next_run": next_run_for(row.schedule)})
+            ).first()
+        db.commit()
+        return row
+
+class AsyncCRUDTask(AsyncCRUDBase[Task, TaskCreate, TaskUpdate]):
+    async def create(self, db: AsyncSession, *, obj_in: TaskCreate) -> Task:
+        obj_in_data = jsonable_encoder(obj_in)
+        obj_in_data["next_run"] = next_run_for(obj_in_data.get("schedule"))
+        db_obj = self.model(**obj_in_data)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Task,
+        obj_in: Union[TaskUpdate, Dict[str, Any]]
     ) -> Task:
-        task = self.get(db, id=task_id)
-        if not task:
+        return await super().update(db, db_obj=db_obj, obj_in=_with_next_run(obj_in))
+
+    async def create_many(
+        self, db: AsyncSession, *, objs_in: List[TaskCreate], user_id: int
+    ) -> Sequence[Row]:
+        """Insert many tasks with a multi-row INSERT, returning their
+        (id, next_run) in input order"""
+        rows = []
+        for obj_in in objs_in:
+            obj_in_data = jsonable_encoder(obj_in)
+            obj_in_data["next_run"] = next_run_for(obj_in_data.get("schedule"))
+            obj_in_data["user_id"] = user_id
+            rows.append(obj_in_data)
+        if not rows:
+            return []
+        result = await db.execute(
+            insert(Task).returning(Task.id, Task.next_run, sort_by_parameter_order=True),
+            rows
+        )
+        created = result.all()
+        await db.commit()
+        return created
+
+    async def queue_tasks(
+        self, db: AsyncSession, *, task_ids: List[int], user_id: Optional[int] = None
+    ) -> Sequence[Row]:
+        """Move the given PENDING tasks to QUEUED in one statement and return
+        their (id, priority, user_id, config); tasks in other states or, when ``user_id`` is
+        given, owned by someone else are left out. Long id lists are
+        updated in chunks within one transaction."""
+        rows: List[Row] = []
+        for chunk in _id_chunks(task_ids):
+            stmt = (
+                update(Task)
+                .where(Task.id.in_(chunk))
+                .where(Task.status == TaskStatus.PENDING)
+            )
+            if user_id is not None:
+                stmt = stmt.where(Task.user_id == user_id)
+            rows.extend((await db.execute(
+                stmt.values(status=TaskStatus.QUEUED)
+                .returning(*DISPATCH_RETURNING)
+                .execution_options(synchronize_session=False)
+            )).all())
+        await db.commit()
+        return rows
+
+    async def release_tasks(self, db: AsyncSession, *, task_ids: List[int]) -> None:
+        """Return queued tasks to PENDING, e.g. when dispatch failed"""
+        for chunk in _id_chunks(task_ids):
+            await db.execute(
+                update(Task)
+                .where(Task.id.in_(chunk))
+                .where(Task.status == TaskStatus.QUEUED)
+                .values(status=TaskStatus.PENDING)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+
+    async def get_user_tasks(
+        self,
+        db: AsyncSession,
+        *,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None
+    ) -> List[Task]:
+        query = _user_tasks_query(user_id, after_id).offset(skip).limit(limit)
+        return list(await db.scalars(query))
+
+    async def update_task_status(
+        self,
+        db: AsyncSession,
+        *,
+        task_id: int,
+        status: TaskStatus,
+        error_message: Optional[str] = None,
+        result_ref: Optional[str] = None,
+        from_status: Optional[Sequence[TaskStatus]] = None,
+        schedule: Optional[str] = None
+    ) -> Optional[Row]:
+        """Async variant of CRUDTask.update_task_status"""
+        if from_status is None:
+            from_status = ALLOWED_TRANSITIONS[status]
+        values = _status_values(status, error_message, result_ref, schedule)
+        row = (await db.execute(_status_update(task_id, values, from_status))).first()
+        if row is None:
+            await db.rollback()
             return None
-            
-        update_data = {"status": status}
-        if status == TaskStatus.FAILED and error_message:
-            update_data["error_message"] = error_message
-            update_data["retry_count"] = task.retry_count + 1
-            
-        if status == TaskStatus.COMPLETED:
-            update_data["last_run"] = datetime.utcnow()
-            
-        return self.update(db, db_obj=task, obj_in=update_data)
+
+        if status in RESCHEDULABLE_STATUSES and row.schedule and "next_run" not in values:
+            row = (await db.execute(
+                _status_update(task_id, {"next_run": next_run_for(row.schedule)})
+            )).first()
+        await db.commit()
+        return row
 
 task = CRUDTask(Task)
+task_async = AsyncCRUDTask(Task)
@@ -0,0 +1,15 @@
+from functools import lru_cache
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+@lru_cache()
+def get_redis() -> aioredis.Redis:
+    return aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+@lru_cache()
+def get_sync_redis() -> redis.Redis:
+    return redis.from_url(settings.REDIS_URL, decode_responses=True)
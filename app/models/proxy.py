@@ -21,6 +21,8 @@ class Proxy(Base):
     # Performance metrics
     success_count = Column(Integer, default=0)
     failure_count = Column(Integer, default=0)
+    # Failed health checks in a row, across all workers
+    consecutive_failures = Column(Integer, default=0, nullable=False, server_default="0")
     average_response_time = Column(Float, default=0.0)
     
     # Metadata
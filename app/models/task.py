@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON, ForeignKey, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import enum
 
@@ -7,6 +7,7 @@ from app.db.base_class import Base
 
 class TaskStatus(str, enum.Enum):
     PENDING = "pending"
+    QUEUED = "queued"
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
@@ -19,6 +20,13 @@ class TaskPriority(int, enum.Enum):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Scheduler: due tasks by status and next_run, then priority
+        Index("ix_tasks_status_next_run_priority", "status", "next_run", "priority"),
+        # Listing by status / by owner with keyset pagination on id
+        Index("ix_tasks_status_id", "status", "id"),
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -40,7 +48,8 @@ class Task(Base):
     retry_count = Column(Integer, default=0)
     
     # Results
-    result = Column(JSON, nullable=True)
+    result = deferred(Column(JSON, nullable=True))  # Legacy, results now live in the result store
+    result_ref = Column(String, nullable=True)  # run_id of the latest run that stored results
     error_message = Column(String, nullable=True)
     
     # Relationships
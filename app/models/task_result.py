@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index
+from datetime import datetime
+
+from app.db.base_class import Base
+
+class TaskResult(Base):
+    __tablename__ = "task_results"
+    __table_args__ = (
+        Index("ix_task_results_task_id_id", "task_id", "id"),
+        Index("ix_task_results_user_id_id", "user_id", "id"),
+        # Latest row per URL of a batch task (ResultStore.get_latest)
+        Index("ix_task_results_task_id_url_id", "task_id", "url", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # All rows written by one run share a run_id, referenced by Task.result_ref
+    run_id = Column(String, index=True)
+    url = Column(String)
+    data = Column(JSON)
+    content_hash = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
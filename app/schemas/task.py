@@ -1,7 +1,8 @@
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, validator
 from datetime import datetime
 from app.models.task import TaskStatus, TaskPriority
+from app.services.cron import compile_cron
 
 class TaskBase(BaseModel):
     name: str
@@ -12,6 +13,12 @@ class TaskBase(BaseModel):
     headers: Optional[Dict[str, str]] = None
     cookies: Optional[Dict[str, str]] = None
 
+    @validator("schedule")
+    def validate_schedule(cls, v: Optional[str]) -> Optional[str]:
+        if v:
+            compile_cron(v)
+        return v
+
 class TaskCreate(TaskBase):
     pass
 
@@ -30,6 +37,7 @@ class TaskInDBBase(TaskBase):
     last_run: Optional[datetime]
     next_run: Optional[datetime]
     retry_count: int
+    result_ref: Optional[str] = None
     user_id: int
 
     class Config:
@@ -40,3 +48,21 @@ class Task(TaskInDBBase):
 
 class TaskInDB(TaskInDBBase):
     pass
+
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate]
+
+class TaskBulkStart(BaseModel):
+    task_ids: List[int]
+
+class TaskIds(BaseModel):
+    ids: List[int]
+
+class TaskBulkStartResult(BaseModel):
+    started: List[int]
+    skipped: List[int]
+
+class TaskResult(BaseModel):
+    url: Optional[str]
+    data: Optional[Dict[str, Any]]
+    created_at: datetime
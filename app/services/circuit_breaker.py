@@ -0,0 +1,170 @@
+from typing import Optional
+from collections import OrderedDict
+import time
+import logging
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Admission check. Returns 0 when closed, 1 when this caller won the
+# half-open probe, or -wait_ms while open or another probe is in flight.
+ALLOW_SCRIPT = """
+local opened = redis.call('PTTL', KEYS[1])
+if opened > 0 then
+    return -opened
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    if redis.call('SET', KEYS[3], 1, 'NX', 'PX', ARGV[1]) then
+        return 1
+    end
+    return -math.max(1, redis.call('PTTL', KEYS[3]))
+end
+return 0
+"""
+
+# Record a failure. Returns the open time in ms when the circuit is (still)
+# open afterwards, else 0. A failed probe re-opens with a doubled open time.
+FAILURE_SCRIPT = """
+local opened = redis.call('PTTL', KEYS[2])
+if opened > 0 then
+    return opened
+end
+local base = tonumber(ARGV[3])
+local cap = tonumber(ARGV[4])
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    local trips = redis.call('INCR', KEYS[3])
+    local open_ms = math.floor(math.min(cap, base * 2 ^ (trips - 1)))
+    redis.call('SET', KEYS[2], 1, 'PX', open_ms)
+    redis.call('DEL', KEYS[4])
+    return open_ms
+end
+local failures = redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+if failures >= tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], 1, 'PX', base)
+    redis.call('SET', KEYS[3], 1)
+    redis.call('DEL', KEYS[1])
+    return base
+end
+return 0
+"""
+
+class HostCircuit:
+    """Local view of one host's circuit"""
+    __slots__ = ("open_until", "closed_until", "probing")
+
+    def __init__(self):
+        self.open_until = 0.0
+        self.closed_until = 0.0
+        # Set while this process holds the half-open probe, whose success
+        # closes the circuit
+        self.probing = False
+
+class CircuitBreaker:
+    """Per-host circuit breaker shared through Redis.
+
+    A host's circuit opens after ``CIRCUIT_FAILURE_THRESHOLD`` consecutive
+    failures within ``CIRCUIT_FAILURE_WINDOW`` and rejects requests until it
+    half-opens, when a single probe request is let through; its success
+    closes the circuit, its failure re-opens it for twice as long. Open and
+    closed verdicts are cached locally so healthy hosts rarely touch Redis;
+    the cache keeps the ``CIRCUIT_MAX_HOSTS`` most recently used hosts.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.failures_prefix = "circuit_failures:"
+        self.open_prefix = "circuit_open:"
+        self.half_open_prefix = "circuit_half_open:"
+        self.probe_prefix = "circuit_probe:"
+        self._hosts: "OrderedDict[str, HostCircuit]" = OrderedDict()
+        self._allow_script = None
+        self._failure_script = None
+
+    def _state(self, host: str) -> HostCircuit:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostCircuit()
+            while len(self._hosts) > settings.CIRCUIT_MAX_HOSTS:
+                self._hosts.popitem(last=False)
+        self._hosts.move_to_end(host)
+        return state
+
+    async def allow(self, host: Optional[str], probe_timeout: float = 30.0) -> float:
+        """Return 0 when a request to ``host`` may proceed, else the seconds
+        until the circuit may admit one. A probe that does not report back
+        within ``probe_timeout`` is given up and another one let through."""
+        if not host or not settings.CIRCUIT_BREAKER_ENABLED:
+            return 0.0
+        state = self._state(host)
+        now = time.monotonic()
+        if state.open_until > now:
+            return state.open_until - now
+        if state.closed_until > now:
+            return 0.0
+
+        if self._allow_script is None:
+            self._allow_script = self.redis.register_script(ALLOW_SCRIPT)
+        try:
+            verdict = int(await self._allow_script(
+                keys=[f"{self.open_prefix}{host}", f"{self.half_open_prefix}{host}",
+                      f"{self.probe_prefix}{host}"],
+                args=[int(probe_timeout * 1000)]
+            ))
+        except Exception as e:
+            # Without Redis the breaker stays out of the way
+            logger.error(f"Error checking circuit for {host}: {str(e)}")
+            return 0.0
+        if verdict == 0:
+            state.closed_until = now + settings.CIRCUIT_CACHE_TTL
+            return 0.0
+        if verdict == 1:
+            state.probing = True
+            return 0.0
+        state.open_until = now - verdict / 1000
+        return -verdict / 1000
+
+    async def record_failure(self, host: Optional[str]):
+        """Count a failure that suggests the host is down"""
+        if not host or not settings.CIRCUIT_BREAKER_ENABLED:
+            return
+        state = self._state(host)
+        state.probing = False
+        if self._failure_script is None:
+            self._failure_script = self.redis.register_script(FAILURE_SCRIPT)
+        try:
+            open_ms = int(await self._failure_script(
+                keys=[f"{self.failures_prefix}{host}", f"{self.open_prefix}{host}",
+                      f"{self.half_open_prefix}{host}", f"{self.probe_prefix}{host}"],
+                args=[settings.CIRCUIT_FAILURE_THRESHOLD,
+                      int(settings.CIRCUIT_FAILURE_WINDOW * 1000),
+                      int(settings.CIRCUIT_OPEN_TIME * 1000),
+                      int(settings.CIRCUIT_MAX_OPEN_TIME * 1000)]
+            ))
+        except Exception as e:
+            logger.error(f"Error recording failure for {host}: {str(e)}")
+            return
+        if open_ms > 0:
+            logger.warning(f"Circuit open for {host} for {open_ms} ms")
+            state.open_until = time.monotonic() + open_ms / 1000
+            state.closed_until = 0.0
+
+    async def record_success(self, host: Optional[str]):
+        """Reset the host's failures, closing the circuit after a probe.
+
+        The failure count is shared, so it is reset on every success, not
+        only when this process saw a failure; otherwise failures from
+        several workers would add up across successes."""
+        if not host or not settings.CIRCUIT_BREAKER_ENABLED:
+            return
+        state = self._state(host)
+        keys = [f"{self.failures_prefix}{host}"]
+        if state.probing:
+            state.probing = False
+            keys += [f"{self.half_open_prefix}{host}", f"{self.probe_prefix}{host}"]
+        try:
+            await self.redis.delete(*keys)
+        except Exception as e:
+            logger.error(f"Error resetting circuit for {host}: {str(e)}")
@@ -1,58 +1,132 @@
 from typing import Dict, Optional
+from collections import OrderedDict
 import json
+import math
+import time
 import aiohttp
 from datetime import datetime, timedelta
 import logging
+from redis.exceptions import ResponseError, WatchError
+
+from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 class CookieManager:
-    def __init__(self, redis_client):
+    def __init__(self, redis_client,
+                 cache_ttl: float = settings.COOKIE_CACHE_TTL,
+                 cache_size: int = settings.COOKIE_CACHE_SIZE):
         self.redis = redis_client
         self.cookie_key_prefix = "cookies:"
+        # 旧版本单独保存过期时间的键，保存或删除时一并清理
         self.expiry_key_prefix = "cookie_expiry:"
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        # 进程内读缓存：domain -> (过期时间, cookies)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _cached(self, domain: str):
+        entry = self._cache.get(domain)
+        if entry is None:
+            return None
+        expires, cookies = entry
+        if expires <= time.monotonic():
+            del self._cache[domain]
+            return None
+        self._cache.move_to_end(domain)
+        return entry
+
+    def _store(self, domain: str, cookies: Optional[Dict], ttl_ms: int = -1):
+        # 缓存时间不超过Redis中键的剩余TTL
+        ttl = self.cache_ttl
+        if ttl_ms > 0:
+            ttl = min(ttl, ttl_ms / 1000)
+        self._cache[domain] = (time.monotonic() + ttl, cookies)
+        self._cache.move_to_end(domain)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
         
     async def get_cookies(self, domain: str) -> Optional[Dict]:
-        """获取指定域名的Cookie"""
+        """获取指定域名的Cookie（先查进程内缓存）"""
+        entry = self._cached(domain)
+        if entry is not None:
+            return entry[1]
+        key = f"{self.cookie_key_prefix}{domain}"
         try:
-            cookies = await self.redis.get(f"{self.cookie_key_prefix}{domain}")
-            if cookies:
-                return json.loads(cookies)
-            return None
+            async with self.redis.pipeline(transaction=False) as pipe:
+                cookies, ttl_ms = await pipe.hgetall(key).pttl(key).execute()
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                logger.error(f"Error getting cookies for {domain}: {str(e)}")
+                return None
+            # 旧版本以JSON字符串保存，读取时迁移为哈希
+            return await self._migrate_legacy(domain)
         except Exception as e:
             logger.error(f"Error getting cookies for {domain}: {str(e)}")
             return None
+        cookies = cookies or None
+        self._store(domain, cookies, ttl_ms)
+        return cookies
+
+    async def _migrate_legacy(self, domain: str) -> Optional[Dict]:
+        """读取旧格式（JSON字符串 + cookie_expiry:时间戳）的Cookie并转换为哈希"""
+        key = f"{self.cookie_key_prefix}{domain}"
+        expiry_key = f"{self.expiry_key_prefix}{domain}"
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                # WATCH防止覆盖迁移期间其他进程写入的新值
+                await pipe.watch(key, expiry_key)
+                if await pipe.type(key) != "string":
+                    await pipe.unwatch()
+                    return await self.get_cookies(domain)
+                raw = await pipe.get(key)
+                expiry = await pipe.get(expiry_key)
+                cookies = json.loads(raw) or None
+                ttl = None
+                if expiry:
+                    # 旧版本保存的是 datetime.utcnow() 的时间戳
+                    remaining = float(expiry) - datetime.utcnow().timestamp()
+                    if remaining <= 0:
+                        cookies = None
+                    else:
+                        ttl = math.ceil(remaining)
+                pipe.multi()
+                pipe.delete(key, expiry_key)
+                if cookies:
+                    pipe.hset(key, mapping=cookies)
+                    if ttl:
+                        pipe.expire(key, ttl)
+                await pipe.execute()
+            self._store(domain, cookies, ttl * 1000 if ttl else -1)
+            return cookies
+        except WatchError:
+            # 其他进程已迁移或改写，重新读取
+            return await self.get_cookies(domain)
+        except Exception as e:
+            logger.error(f"Error migrating cookies for {domain}: {str(e)}")
+            return None
             
     async def save_cookies(self, domain: str, cookies: Dict, 
                           expiry: Optional[timedelta] = None):
-        """保存Cookie信息"""
+        """保存Cookie信息，过期时间使用Redis原生TTL"""
+        key = f"{self.cookie_key_prefix}{domain}"
         try:
-            await self.redis.set(
-                f"{self.cookie_key_prefix}{domain}",
-                json.dumps(cookies)
-            )
-            
-            if expiry:
-                expiry_time = datetime.utcnow() + expiry
-                await self.redis.set(
-                    f"{self.expiry_key_prefix}{domain}",
-                    expiry_time.timestamp()
-                )
+            # MULTI中替换整个哈希并设置TTL，读者不会看到半写入的状态
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key, f"{self.expiry_key_prefix}{domain}")
+                if cookies:
+                    pipe.hset(key, mapping=cookies)
+                    if expiry:
+                        pipe.expire(key, expiry)
+                await pipe.execute()
+            self._cache.pop(domain, None)
         except Exception as e:
             logger.error(f"Error saving cookies for {domain}: {str(e)}")
             
     async def is_expired(self, domain: str) -> bool:
-        """检查Cookie是否过期"""
-        try:
-            expiry = await self.redis.get(f"{self.expiry_key_prefix}{domain}")
-            if not expiry:
-                return True
-                
-            expiry_time = datetime.fromtimestamp(float(expiry))
-            return datetime.utcnow() > expiry_time
-        except Exception as e:
-            logger.error(f"Error checking cookie expiry for {domain}: {str(e)}")
-            return True
+        """检查Cookie是否过期（键已被Redis按TTL删除即为过期）"""
+        return await self.get_cookies(domain) is None
             
     async def refresh_cookies(self, domain: str, 
                             login_url: str,
@@ -77,16 +151,23 @@ class CookieManager:
     async def delete_cookies(self, domain: str):
         """删除Cookie"""
         try:
-            await self.redis.delete(f"{self.cookie_key_prefix}{domain}")
-            await self.redis.delete(f"{self.expiry_key_prefix}{domain}")
+            await self.redis.delete(
+                f"{self.cookie_key_prefix}{domain}",
+                f"{self.expiry_key_prefix}{domain}"
+            )
+            self._cache.pop(domain, None)
         except Exception as e:
             logger.error(f"Error deleting cookies for {domain}: {str(e)}")
             
     async def get_all_domains(self) -> list:
-        """获取所有保存的Cookie域名"""
+        """获取所有保存的Cookie域名（SCAN增量遍历，不阻塞Redis）"""
         try:
-            keys = await self.redis.keys(f"{self.cookie_key_prefix}*")
-            return [k.replace(self.cookie_key_prefix, "") for k in keys]
+            return [
+                k.replace(self.cookie_key_prefix, "", 1)
+                async for k in self.redis.scan_iter(
+                    match=f"{self.cookie_key_prefix}*", count=500
+                )
+            ]
         except Exception as e:
             logger.error(f"Error getting cookie domains: {str(e)}")
             return []
@@ -0,0 +1,200 @@
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTH_NAMES = {
+    name: i + 1 for i, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun",
+         "jul", "aug", "sep", "oct", "nov", "dec"]
+    )
+}
+DAY_NAMES = {
+    name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])
+}
+
+# (low, high, names) for minute, hour, day of month, month, day of week
+FIELDS = [
+    (0, 59, None),
+    (0, 23, None),
+    (1, 31, None),
+    (1, 12, MONTH_NAMES),
+    (0, 7, DAY_NAMES),
+]
+
+# Give up on expressions that never fire (e.g. "0 0 30 2 *")
+MAX_SEARCH_YEARS = 5
+
+def _parse_value(value: str, names: Optional[Dict[str, int]]) -> int:
+    if names and value.lower() in names:
+        return names[value.lower()]
+    return int(value)
+
+def _parse_field(field: str, low: int, high: int,
+                 names: Optional[Dict[str, int]]) -> Tuple[List[int], bool]:
+    """Expand one cron field into its sorted values and whether it is '*'"""
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+            if step <= 0:
+                raise ValueError(f"Invalid step in cron field: {field}")
+        if part in ("*", "?"):
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = _parse_value(start_str, names), _parse_value(end_str, names)
+        else:
+            start = _parse_value(part, names)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return sorted(values), field in ("*", "?")
+
+class CronExpression:
+    """A cron expression compiled into sorted value lists.
+
+    Supports the standard five fields with lists, ranges, steps, month and
+    weekday names and the ``@daily``-style macros. When both day of month
+    and day of week are restricted a day matching either fires, as in
+    Vixie cron. Times are naive UTC, like ``Task.next_run``.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+        parsed = [_parse_field(f, low, high, names)
+                  for f, (low, high, names) in zip(fields, FIELDS)]
+        self.minutes, _ = parsed[0]
+        self.hours, _ = parsed[1]
+        self.days, self.any_day = parsed[2]
+        self.months, _ = parsed[3]
+        weekdays, self.any_weekday = parsed[4]
+        # Sunday may be written as 0 or 7; cron counts Monday as 1
+        self.weekdays = {d % 7 for d in weekdays}
+
+    def _day_matches(self, t: datetime) -> bool:
+        weekday = (t.weekday() + 1) % 7
+        if self.any_day:
+            return weekday in self.weekdays
+        if self.any_weekday:
+            return t.day in self.days
+        return t.day in self.days or weekday in self.weekdays
+
+    def next_fire(self, after: datetime) -> datetime:
+        """First fire time strictly after ``after``"""
+        if after.tzinfo is not None:
+            after = after.astimezone(timezone.utc).replace(tzinfo=None)
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + MAX_SEARCH_YEARS
+        while t.year <= limit:
+            if t.month not in self.months:
+                i = bisect_right(self.months, t.month)
+                if i < len(self.months):
+                    t = datetime(t.year, self.months[i], 1)
+                else:
+                    t = datetime(t.year + 1, self.months[0], 1)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if t.hour not in self.hours:
+                i = bisect_right(self.hours, t.hour)
+                if i < len(self.hours):
+                    t = t.replace(hour=self.hours[i], minute=0)
+                else:
+                    t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if t.minute not in self.minutes:
+                i = bisect_left(self.minutes, t.minute)
+                if i < len(self.minutes):
+                    t = t.replace(minute=self.minutes[i])
+                else:
+                    t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            return t
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+@lru_cache(maxsize=1024)
+def compile_cron(expression: str) -> CronExpression:
+    """Get the compiled form of a cron expression"""
+    return CronExpression(expression)
+
+def next_run_for(schedule: Optional[str],
+                 after: Optional[datetime] = None) -> Optional[datetime]:
+    """Next fire time for a task schedule, or None when it has none"""
+    if not schedule:
+        return None
+    return compile_cron(schedule).next_fire(after or datetime.utcnow())
+
+# Pops up to ARGV[2] members scored at or before ARGV[1] in one step
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+class CronSchedule:
+    """Redis sorted set of upcoming task fires, scored by ``next_run``.
+
+    The scheduler pops due task ids from here instead of scanning the tasks
+    table; ``sync`` re-seeds it from the database.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.key = "task_schedule"
+        self._pop_due = redis_client.register_script(POP_DUE_SCRIPT)
+
+    @staticmethod
+    def _score(when: datetime) -> float:
+        return when.replace(tzinfo=timezone.utc).timestamp()
+
+    def add(self, task_id: int, next_run: Optional[datetime]):
+        """Schedule a task's next fire, or unschedule it if there is none"""
+        try:
+            if next_run is None:
+                self.redis.zrem(self.key, task_id)
+            else:
+                self.redis.zadd(self.key, {task_id: self._score(next_run)})
+        except Exception as e:
+            logger.error(f"Error scheduling task {task_id}: {str(e)}")
+
+    def remove(self, task_id: int):
+        try:
+            self.redis.zrem(self.key, task_id)
+        except Exception as e:
+            logger.error(f"Error unscheduling task {task_id}: {str(e)}")
+
+    def pop_due(self, now: Optional[datetime] = None, limit: int = 500) -> List[int]:
+        """Remove and return the ids of tasks due at ``now``"""
+        now = now or datetime.utcnow()
+        due = self._pop_due(keys=[self.key], args=[self._score(now), limit])
+        return [int(task_id) for task_id in due]
+
+    def sync(self, entries: List[Tuple[int, datetime]]):
+        """Add or refresh many fires at once"""
+        if entries:
+            self.redis.zadd(
+                self.key, {task_id: self._score(when) for task_id, when in entries}
+            )
@@ -0,0 +1,102 @@
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import re
+import logging
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def fingerprint(value: Any) -> str:
+    """Fast stable hash of a page body or of extracted data"""
+    if not isinstance(value, (str, bytes)):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return hashlib.blake2b(value, digest_size=16).hexdigest()
+
+def simhash(value: Any, bits: int = 64) -> int:
+    """SimHash of the tokens in ``value`` for near-duplicate detection"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    weights = [0] * bits
+    for token in _TOKEN_RE.findall(value.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(bits):
+            weights[i] += 1 if h >> i & 1 else -1
+    return sum(1 << i for i in range(bits) if weights[i] > 0)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class Deduplicator:
+    """Remembers the last fingerprint stored for each result key in Redis
+    and reports whether a new result is unchanged. Checking is read-only;
+    the caller commits the new fingerprint after storing the result, so a
+    failed store is not mistaken for a duplicate next time. Fingerprints
+    expire after ``DEDUP_TTL`` seconds without being committed."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.key_prefix = "dedup:"
+
+    async def check(self, key: str, data: Any,
+                    content_hash: Optional[str] = None,
+                    max_distance: Optional[int] = None) -> Tuple[bool, Dict[str, str]]:
+        """Check a result against the last one committed under ``key``.
+
+        A result is a duplicate when its page body or extracted data hash
+        matches, or, when ``max_distance`` is given, when the SimHash of the
+        data is within that Hamming distance. Nothing is written; returns
+        ``(duplicate, fingerprints)`` for ``commit``.
+        """
+        fingerprints: Dict[str, str] = {"data": fingerprint(data)}
+        if content_hash:
+            fingerprints["content"] = content_hash
+        if max_distance is not None:
+            fingerprints["simhash"] = str(simhash(data))
+        try:
+            previous = await self.redis.hgetall(f"{self.key_prefix}{key}")
+        except Exception as e:
+            logger.error(f"Error checking duplicates for {key}: {str(e)}")
+            return False, fingerprints
+        duplicate = bool(previous) and (
+            previous.get("data") == fingerprints["data"]
+            or bool(content_hash and previous.get("content") == content_hash)
+            or (max_distance is not None and bool(previous.get("simhash")) and
+                hamming_distance(int(previous["simhash"]),
+                                 int(fingerprints["simhash"])) <= max_distance)
+        )
+        return duplicate, fingerprints
+
+    async def commit(self, key: str, fingerprints: Optional[Dict[str, str]]):
+        """Record the fingerprints of a result once it has been stored.
+
+        Pass None for a duplicate: the stored fingerprint is kept (so near
+        duplicates do not drift) and only its expiry is refreshed.
+        """
+        redis_key = f"{self.key_prefix}{key}"
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if fingerprints:
+                    pipe.delete(redis_key)
+                    pipe.hset(redis_key, mapping=fingerprints)
+                pipe.expire(redis_key, settings.DEDUP_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error saving fingerprint for {key}: {str(e)}")
+
+    async def forget(self, key: str):
+        """Drop the stored fingerprint for ``key`` and those nested under it
+        (``key:<url>`` in batch mode)"""
+        try:
+            nested = [k async for k in self.redis.scan_iter(
+                match=f"{self.key_prefix}{key}:*", count=500
+            )]
+            await self.redis.delete(f"{self.key_prefix}{key}", *nested)
+        except Exception as e:
+            logger.error(f"Error deleting fingerprint for {key}: {str(e)}")
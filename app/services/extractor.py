@@ -0,0 +1,128 @@
+from typing import Dict, List, Any, Tuple, Union
+from functools import lru_cache
+from bs4 import BeautifulSoup, Tag
+import soupsieve
+import json
+import logging
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Parser backends selectable via task config["parser"]
+BS4_PARSERS = ("html.parser", "lxml", "html5lib")
+SELECTOLAX_PARSER = "selectolax"
+
+class ExtractionPlan:
+    """Selectors compiled once per task definition.
+
+    ``selectors`` maps a key either to a CSS selector string or to a scoped
+    group ``{"scope": "<selector>", "fields": {key: selector}}``. Plain keys
+    yield a list of texts, scoped groups yield one record per scope element.
+    Plain keys use their compiled selector directly; the fields of a scoped
+    group are matched in a single walk over each scope element, which beats
+    one ``select`` per field and record.
+    """
+
+    def __init__(self, selectors: Dict[str, Union[str, Dict]]):
+        self.selectors = selectors
+        self.fields: List[Tuple[str, Any]] = []
+        self.groups: List[Tuple[str, Any, List[Tuple[str, Any]]]] = []
+        for key, selector in selectors.items():
+            if isinstance(selector, dict):
+                fields = [
+                    (name, soupsieve.compile(sel))
+                    for name, sel in selector.get("fields", {}).items()
+                ]
+                self.groups.append((key, soupsieve.compile(selector["scope"]), fields))
+            else:
+                self.fields.append((key, soupsieve.compile(selector)))
+
+    @staticmethod
+    def _match_fields(root: Tag, fields: List[Tuple[str, Any]]) -> Dict[str, List[str]]:
+        result = {name: [] for name, _ in fields}
+        if not fields:
+            return result
+        for el in root.descendants:
+            if not isinstance(el, Tag):
+                continue
+            for name, pattern in fields:
+                if pattern.match(el):
+                    result[name].append(el.get_text(strip=True))
+        return result
+
+    def extract(self, soup: BeautifulSoup) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            key: [el.get_text(strip=True) for el in pattern.select(soup)]
+            for key, pattern in self.fields
+        }
+        for key, scope, fields in self.groups:
+            result[key] = [
+                self._match_fields(el, fields) for el in scope.select(soup)
+            ]
+        return result
+
+    def extract_selectolax(self, tree) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for key, selector in self.selectors.items():
+            if isinstance(selector, dict):
+                result[key] = [
+                    {
+                        name: [n.text(strip=True) for n in node.css(sel)]
+                        for name, sel in selector.get("fields", {}).items()
+                    }
+                    for node in tree.css(selector["scope"])
+                ]
+            else:
+                result[key] = [n.text(strip=True) for n in tree.css(selector)]
+        return result
+
+class StopMatcher:
+    """Incrementally parses a streamed body and reports when an element
+    matching ``selector`` has been fully received."""
+
+    def __init__(self, selector: str):
+        from lxml import etree
+        from lxml.cssselect import CSSSelector
+
+        self._parser = etree.HTMLPullParser(events=("end",))
+        self._selector = CSSSelector(selector)
+
+    def feed(self, chunk: bytes) -> bool:
+        self._parser.feed(chunk)
+        for _, el in self._parser.read_events():
+            if self._selector(el):
+                return True
+        return False
+
+@lru_cache(maxsize=settings.SELECTOR_PLAN_CACHE_SIZE)
+def _compile_plan(key: str) -> ExtractionPlan:
+    return ExtractionPlan(json.loads(key))
+
+def get_extraction_plan(selectors: Dict[str, Union[str, Dict]]) -> ExtractionPlan:
+    """Get the compiled plan for a selector dict, cached by its content"""
+    return _compile_plan(json.dumps(selectors, sort_keys=True))
+
+def _extract_with_selectolax(content: str, plan: ExtractionPlan) -> Dict[str, Any]:
+    from selectolax.parser import HTMLParser
+
+    return plan.extract_selectolax(HTMLParser(content))
+
+def parse_and_extract(content: str, selectors: Dict[str, Union[str, Dict]],
+                      parser: str = "html.parser") -> Dict[str, Any]:
+    """Parse HTML and extract data in one step.
+
+    Module-level and free of shared state so it can run in a process pool;
+    only the extracted data is sent back to the caller.
+    """
+    plan = get_extraction_plan(selectors)
+    if parser == SELECTOLAX_PARSER:
+        try:
+            return _extract_with_selectolax(content, plan)
+        except ImportError:
+            logger.warning("selectolax is not installed, falling back to lxml")
+            parser = "lxml"
+    if parser not in BS4_PARSERS:
+        raise ValueError(f"Unsupported parser: {parser}")
+    return plan.extract(BeautifulSoup(content, parser))
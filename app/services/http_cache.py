@@ -0,0 +1,108 @@
+from typing import Dict, Mapping, Optional
+import hashlib
+import json
+import time
+import logging
+
+from multidict import CIMultiDict
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class HTTPCache:
+    """Redis-backed store of HTTP validators (ETag / Last-Modified) and,
+    optionally, response bodies for conditional requests.
+
+    Entries are evicted least-recently-used first once their total size
+    exceeds ``HTTP_CACHE_MAX_BYTES``.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.key_prefix = "http_cache:"
+        self.lru_key = "http_cache_lru"
+        self.size_key = "http_cache_size"
+
+    def _key(self, url: str, variant: str = "") -> str:
+        return f"{self.key_prefix}{hashlib.sha1(f'{variant}|{url}'.encode()).hexdigest()}"
+
+    async def get(self, url: str, variant: str = "") -> Optional[Dict]:
+        """Get the cached entry for a URL.
+
+        ``variant`` separates entries for the same URL, e.g. per task and
+        extraction config, so validators are only reused by the caller whose
+        stored result they describe.
+        """
+        try:
+            key = self._key(url, variant)
+            entry = await self.redis.get(key)
+            if entry:
+                await self.redis.zadd(self.lru_key, {key: time.time()})
+                return json.loads(entry)
+            return None
+        except Exception as e:
+            logger.error(f"Error reading HTTP cache for {url}: {str(e)}")
+            return None
+
+    def get_validators(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Build conditional request headers from a cached entry"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def build_entry(response_headers: Mapping[str, str],
+                    content: Optional[str] = None) -> Optional[Dict]:
+        """Build an entry from the validators (and optionally the body) of a
+        200 response, or None when it has no validators"""
+        # Header names are case-insensitive; servers send "Etag" or "etag" too
+        response_headers = CIMultiDict(response_headers)
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        if content is not None and len(content) > settings.HTTP_CACHE_MAX_BODY_BYTES:
+            content = None
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content": content,
+        }
+
+    async def save(self, url: str, entry: Dict, variant: str = ""):
+        """Store an entry built by ``build_entry``"""
+        key = self._key(url, variant)
+        value = json.dumps(entry)
+        try:
+            previous = await self.redis.set(key, value, get=True)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(self.lru_key, {key: time.time()})
+                pipe.incrby(self.size_key, len(value) - len(previous or ""))
+                _, size = await pipe.execute()
+            if size > settings.HTTP_CACHE_MAX_BYTES:
+                await self._evict()
+        except Exception as e:
+            logger.error(f"Error saving HTTP cache for {url}: {str(e)}")
+
+    async def _evict(self):
+        """Drop the oldest entries until the cache is back under its limit"""
+        target = int(settings.HTTP_CACHE_MAX_BYTES * 0.9)
+        size = int(await self.redis.get(self.size_key) or 0)
+        while size > target:
+            oldest = await self.redis.zpopmin(self.lru_key, 100)
+            if not oldest:
+                await self.redis.set(self.size_key, 0)
+                return
+            keys = [key for key, _ in oldest]
+            entries = await self.redis.mget(keys)
+            freed = sum(len(e) for e in entries if e)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(*keys)
+                pipe.decrby(self.size_key, freed)
+                _, size = await pipe.execute()
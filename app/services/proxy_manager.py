@@ -1,83 +1,326 @@
 import aiohttp
 import asyncio
-from typing import Optional, List
+import heapq
+import itertools
+from typing import Optional, List, Dict, Tuple
 import logging
 from datetime import datetime, timedelta
 
+from sqlalchemy import bindparam, update
+
 from app.models.proxy import Proxy
 from app.core.config import get_settings
+from app.db.session import SessionLocal
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+class ProxyState:
+    """Live selection metrics for one proxy"""
+    __slots__ = ("proxy", "url", "successes", "failures", "latency",
+                 "in_flight", "consecutive_failures", "cooldown_until", "version")
+
+    def __init__(self, proxy: Proxy):
+        self.proxy = proxy
+        self.url = proxy.url
+        self.successes = proxy.success_count or 0
+        self.failures = proxy.failure_count or 0
+        self.latency = proxy.average_response_time or 0.0
+        self.in_flight = 0
+        self.consecutive_failures = proxy.consecutive_failures or 0
+        self.cooldown_until = 0.0
+        self.version = 0
+
+    @property
+    def score(self) -> float:
+        # Laplace-smoothed success rate over latency, shared by in-flight requests
+        success_rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        return success_rate / (1.0 + self.latency) / (1 + self.in_flight)
+
 class ProxyManager:
     def __init__(self):
-        self._proxies = []
+        self._proxies: Dict[str, ProxyState] = {}
+        # Max-heap of (-score, tiebreak, version, url); stale versions are skipped
+        self._heap: List[Tuple[float, int, int, str]] = []
+        # Min-heap of (cooldown_until, url) for proxies benched after failures
+        self._cooldown: List[Tuple[float, str]] = []
+        self._affinity: Dict[str, str] = {}
+        self._counter = itertools.count()
         self._last_update = None
         
+    def _push(self, state: ProxyState):
+        state.version += 1
+        heapq.heappush(
+            self._heap, (-state.score, next(self._counter), state.version, state.url)
+        )
+        if len(self._heap) > 2 * len(self._proxies) + 64:
+            self._rebuild_heap()
+            
+    def _rebuild_heap(self):
+        """Drop stale entries accumulated by score updates"""
+        now = asyncio.get_event_loop().time()
+        self._heap = [
+            (-state.score, next(self._counter), state.version, state.url)
+            for state in self._proxies.values()
+            if state.cooldown_until <= now
+        ]
+        heapq.heapify(self._heap)
+        
+    def _track(self, proxy: Proxy):
+        state = ProxyState(proxy)
+        self._proxies[state.url] = state
+        self._push(state)
+        
+    def _release_cooldowns(self, now: float):
+        while self._cooldown and self._cooldown[0][0] <= now:
+            _, url = heapq.heappop(self._cooldown)
+            state = self._proxies.get(url)
+            if state is not None and state.cooldown_until <= now:
+                self._push(state)
+        
+    @staticmethod
+    def _load_active_proxies() -> List[Proxy]:
+        db = SessionLocal()
+        try:
+            proxies = db.query(Proxy).filter(Proxy.is_active == True).all()
+            db.expunge_all()
+            return proxies
+        finally:
+            db.close()
+            
+    @staticmethod
+    def _save_check_results(checked_at: datetime,
+                            succeeded: List[Dict],
+                            failed_ids: List[int]) -> Dict[int, Tuple[int, bool]]:
+        """Write check results as server-side increments, so the counts of
+        several worker processes add up. Returns {id: (consecutive failures,
+        is_active)} for the failed proxies."""
+        proxies = Proxy.__table__
+        db = SessionLocal()
+        try:
+            if succeeded:
+                # One executemany; only the latency differs between rows
+                db.execute(
+                    update(proxies)
+                    .where(proxies.c.id == bindparam("proxy_id"))
+                    .values(
+                        success_count=proxies.c.success_count + 1,
+                        consecutive_failures=0,
+                        is_active=True,
+                        last_checked=checked_at,
+                        average_response_time=bindparam("latency"),
+                    ),
+                    succeeded
+                )
+            failed = {}
+            if failed_ids:
+                rows = db.execute(
+                    update(proxies)
+                    .where(proxies.c.id.in_(failed_ids))
+                    .values(
+                        failure_count=proxies.c.failure_count + 1,
+                        consecutive_failures=proxies.c.consecutive_failures + 1,
+                        # SET expressions see the row as it was before the update
+                        is_active=proxies.c.consecutive_failures + 1 < settings.MAX_PROXY_FAILURES,
+                        last_checked=checked_at,
+                    )
+                    .returning(proxies.c.id, proxies.c.consecutive_failures,
+                               proxies.c.is_active)
+                ).all()
+                failed = {row.id: (row.consecutive_failures, row.is_active) for row in rows}
+            db.commit()
+            return failed
+        finally:
+            db.close()
+        
     async def update_proxies(self):
         """Update proxy list from database"""
-        # TODO: Implement database query to get active proxies
-        pass
+        loop = asyncio.get_running_loop()
+        proxies = await loop.run_in_executor(None, self._load_active_proxies)
         
-    async def check_proxy(self, proxy: Proxy) -> bool:
+        active = {}
+        for proxy in proxies:
+            state = self._proxies.get(proxy.url)
+            if state is None:
+                state = ProxyState(proxy)
+                self._push(state)
+            else:
+                # Keep live metrics, refresh the row
+                state.proxy = proxy
+            active[state.url] = state
+        self._proxies = active
+        self._affinity = {
+            domain: url for domain, url in self._affinity.items() if url in active
+        }
+        self._rebuild_heap()
+        self._last_update = datetime.utcnow()
+        
+    async def check_proxy(self, proxy: Proxy,
+                          session: Optional[aiohttp.ClientSession] = None) -> bool:
         """Check if proxy is working"""
         try:
-            test_url = "http://httpbin.org/ip"
-            timeout = aiohttp.ClientTimeout(total=10)
-            
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(test_url, proxy=proxy.url) as response:
-                    if response.status == 200:
-                        return True
-            return False
+            if session is None:
+                timeout = aiohttp.ClientTimeout(total=settings.PROXY_CHECK_TIMEOUT)
+                async with aiohttp.ClientSession(timeout=timeout) as own_session:
+                    return await self.check_proxy(proxy, own_session)
+                    
+            async with session.get(settings.PROXY_CHECK_URL, proxy=proxy.url) as response:
+                return response.status == 200
         except Exception as e:
             logger.error(f"Proxy check failed for {proxy.url}: {str(e)}")
             return False
             
-    async def verify_proxies(self):
-        """Verify all proxies in the pool"""
-        tasks = []
-        for proxy in self._proxies:
-            if (datetime.utcnow() - proxy.last_checked) > timedelta(minutes=settings.PROXY_CHECK_INTERVAL):
-                tasks.append(self.check_proxy(proxy))
-                
-        if tasks:
-            results = await asyncio.gather(*tasks)
-            # Update proxy status based on results
-            # TODO: Implement database update
+    async def verify_proxies(self, force: bool = False) -> Dict[str, bool]:
+        """Verify proxies due for a check and write the results back in bulk"""
+        now = datetime.utcnow()
+        interval = timedelta(seconds=settings.PROXY_CHECK_INTERVAL)
+        due = [
+            state for state in self._proxies.values()
+            if force or state.proxy.last_checked is None
+            or now - state.proxy.last_checked > interval
+        ]
+        if not due:
+            return {}
+            
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(settings.PROXY_CHECK_CONCURRENCY)
+        timeout = aiohttp.ClientTimeout(total=settings.PROXY_CHECK_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=settings.PROXY_CHECK_CONCURRENCY)
+        
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            async def _check(state: ProxyState) -> Tuple[bool, float]:
+                async with semaphore:
+                    started = loop.time()
+                    ok = await self.check_proxy(state.proxy, session)
+                    return ok, loop.time() - started
+                    
+            results = await asyncio.gather(*(_check(state) for state in due))
+            
+        checked_at = datetime.utcnow()
+        alpha = settings.PROXY_LATENCY_EWMA_ALPHA
+        succeeded = []
+        for state, (ok, elapsed) in zip(due, results):
+            state.proxy.last_checked = checked_at
+            if ok:
+                state.successes += 1
+                state.consecutive_failures = 0
+                state.cooldown_until = 0.0
+                state.latency = (
+                    elapsed if not state.latency
+                    else alpha * elapsed + (1 - alpha) * state.latency
+                )
+                self._push(state)
+                succeeded.append({"proxy_id": state.proxy.id, "latency": state.latency})
+            else:
+                state.failures += 1
+        failed = await loop.run_in_executor(
+            None, self._save_check_results, checked_at, succeeded,
+            [state.proxy.id for state, (ok, _) in zip(due, results) if not ok]
+        )
+        
+        # The failure streak is counted in the database across all workers
+        for state in due:
+            if state.proxy.id not in failed:
+                continue
+            state.consecutive_failures, state.proxy.is_active = failed[state.proxy.id]
+            if not state.proxy.is_active:
+                self._proxies.pop(state.url, None)
+        return {state.url: ok for state, (ok, _) in zip(due, results)}
             
-    async def get_proxy(self) -> Optional[str]:
-        """Get a working proxy from the pool"""
-        if not self._proxies or (datetime.utcnow() - self._last_update > 
-                                timedelta(minutes=settings.PROXY_CHECK_INTERVAL)):
+    async def get_proxy(self, domain: Optional[str] = None) -> Optional[str]:
+        """Get the best scoring proxy, preferring the last good one for ``domain``"""
+        # An empty pool (no proxies configured) is only re-read on the interval
+        if self._last_update is None or (
+                datetime.utcnow() - self._last_update >
+                timedelta(seconds=settings.PROXY_CHECK_INTERVAL)):
             await self.update_proxies()
             
-        # Simple round-robin selection
-        if self._proxies:
-            proxy = self._proxies.pop(0)
-            self._proxies.append(proxy)
-            return proxy.url
+        now = asyncio.get_running_loop().time()
+        self._release_cooldowns(now)
+        
+        if domain is not None:
+            state = self._proxies.get(self._affinity.get(domain))
+            if state is not None and state.cooldown_until <= now:
+                state.in_flight += 1
+                self._push(state)
+                return state.url
+            
+        while self._heap:
+            _, _, version, url = heapq.heappop(self._heap)
+            state = self._proxies.get(url)
+            if state is None or state.version != version or state.cooldown_until > now:
+                # Cooling proxies are pushed back by _release_cooldowns
+                continue
+            state.in_flight += 1
+            self._push(state)
+            return state.url
         return None
         
+    def release(self, proxy_url: str):
+        """Return a proxy whose request failed for reasons unrelated to it"""
+        state = self._proxies.get(proxy_url)
+        if state is None:
+            return
+        state.in_flight = max(0, state.in_flight - 1)
+        if state.cooldown_until <= asyncio.get_running_loop().time():
+            self._push(state)
+            
+    def report_result(self, proxy_url: str, success: bool,
+                      response_time: Optional[float] = None,
+                      domain: Optional[str] = None):
+        """Feed a fetch outcome back into the proxy's score"""
+        state = self._proxies.get(proxy_url)
+        if state is None:
+            return
+        state.in_flight = max(0, state.in_flight - 1)
+        if success:
+            state.successes += 1
+            state.consecutive_failures = 0
+            if response_time is not None:
+                alpha = settings.PROXY_LATENCY_EWMA_ALPHA
+                state.latency = (
+                    response_time if not state.latency
+                    else alpha * response_time + (1 - alpha) * state.latency
+                )
+            if domain is not None:
+                self._affinity[domain] = proxy_url
+            # A concurrent failure may have benched it; it returns when the cooldown ends
+            if state.cooldown_until <= asyncio.get_running_loop().time():
+                self._push(state)
+        else:
+            state.failures += 1
+            state.consecutive_failures += 1
+            if domain is not None and self._affinity.get(domain) == proxy_url:
+                del self._affinity[domain]
+            # Exponential cooldown; the proxy leaves the heap until it expires
+            state.version += 1
+            state.cooldown_until = asyncio.get_running_loop().time() + min(
+                settings.PROXY_COOLDOWN * 2 ** (state.consecutive_failures - 1),
+                settings.PROXY_MAX_COOLDOWN
+            )
+            heapq.heappush(self._cooldown, (state.cooldown_until, proxy_url))
+        
     async def add_proxy(self, proxy: Proxy):
         """Add a new proxy to the pool"""
         if await self.check_proxy(proxy):
-            self._proxies.append(proxy)
+            self._track(proxy)
             # TODO: Save to database
             return True
         return False
         
     async def remove_proxy(self, proxy: Proxy):
         """Remove a proxy from the pool"""
-        if proxy in self._proxies:
-            self._proxies.remove(proxy)
+        if self._proxies.pop(proxy.url, None) is not None:
+            # Heap entries are dropped lazily on selection
             # TODO: Update database
+            pass
             
     async def get_stats(self) -> dict:
         """Get proxy pool statistics"""
+        now = asyncio.get_running_loop().time()
         return {
             "total_proxies": len(self._proxies),
             "last_update": self._last_update,
-            "working_proxies": len([p for p in self._proxies if p.is_active])
+            "working_proxies": len([s for s in self._proxies.values() if s.proxy.is_active]),
+            "cooling_down": len([s for s in self._proxies.values() if s.cooldown_until > now])
         }
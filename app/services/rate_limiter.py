@@ -0,0 +1,189 @@
+from typing import Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import asyncio
+import time
+import logging
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Token bucket shared by all workers. Returns {granted, wait_ms}; a domain
+# under backoff grants nothing until its block key expires.
+TOKEN_BUCKET_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then
+    return {0, blocked}
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+if granted > 0 then
+    return {granted, 0}
+end
+return {0, math.ceil((1 - tokens) * 1000 / rate)}
+"""
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class DomainState:
+    """Local view of one domain's limits"""
+    __slots__ = ("semaphore", "active", "tokens", "lease_expires",
+                 "blocked_until", "rate_factor", "backoffs")
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(settings.DOMAIN_MAX_CONCURRENCY)
+        # Requests holding or waiting for the semaphore; a busy domain is
+        # never evicted, or its concurrency cap would be split in two
+        self.active = 0
+        self.tokens = 0
+        self.lease_expires = 0.0
+        self.blocked_until = 0.0
+        self.rate_factor = 1.0
+        self.backoffs = 0
+
+class RateLimiter:
+    """Per-domain politeness: a concurrency cap per process plus a token
+    bucket shared through Redis. Tokens are leased from Redis a few at a
+    time so most requests are admitted locally. At most
+    ``RATE_LIMIT_MAX_DOMAINS`` idle domains are remembered; an evicted
+    domain's backoff still holds through its Redis block key."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.bucket_prefix = "rate_limit:"
+        self.block_prefix = "rate_limit_block:"
+        self._domains: "OrderedDict[str, DomainState]" = OrderedDict()
+        self._script = None
+
+    def _state(self, domain: str) -> DomainState:
+        state = self._domains.get(domain)
+        if state is None:
+            self._evict(len(self._domains) + 1 - settings.RATE_LIMIT_MAX_DOMAINS)
+            state = self._domains[domain] = DomainState()
+        self._domains.move_to_end(domain)
+        return state
+
+    def _evict(self, count: int):
+        """Drop up to ``count`` least recently used domains not in use"""
+        if count <= 0:
+            return
+        idle = []
+        for domain, state in self._domains.items():
+            if not state.active:
+                idle.append(domain)
+                if len(idle) == count:
+                    break
+        for domain in idle:
+            del self._domains[domain]
+
+    async def _lease(self, domain: str, state: DomainState) -> float:
+        """Lease tokens from the shared bucket, returning seconds to wait"""
+        if self._script is None:
+            self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        rate = settings.DOMAIN_RATE_LIMIT * state.rate_factor
+        try:
+            granted, wait_ms = await self._script(
+                keys=[f"{self.bucket_prefix}{domain}", f"{self.block_prefix}{domain}"],
+                args=[rate, settings.DOMAIN_BURST, settings.RATE_LIMIT_LEASE_SIZE]
+            )
+        except Exception as e:
+            # Fall back to the local concurrency cap if Redis is unavailable
+            logger.error(f"Error acquiring rate limit for {domain}: {str(e)}")
+            return 0.0
+        if granted:
+            state.tokens = int(granted)
+            state.lease_expires = time.monotonic() + 1.0
+            return 0.0
+        return int(wait_ms) / 1000
+
+    async def acquire(self, domain: str):
+        """Wait until a request to ``domain`` is allowed"""
+        state = self._state(domain)
+        while True:
+            now = time.monotonic()
+            if state.blocked_until > now:
+                await asyncio.sleep(state.blocked_until - now)
+                continue
+            if state.tokens > 0 and state.lease_expires > now:
+                state.tokens -= 1
+                return
+            state.tokens = 0
+            wait = await self._lease(domain, state)
+            if wait <= 0:
+                if state.tokens > 0:
+                    state.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def limit(self, domain: Optional[str]):
+        """Hold a concurrency slot and a token for one request to ``domain``"""
+        if not domain or not settings.RATE_LIMIT_ENABLED:
+            yield
+            return
+        state = self._state(domain)
+        state.active += 1
+        try:
+            async with state.semaphore:
+                await self.acquire(domain)
+                yield
+        finally:
+            state.active -= 1
+
+    async def backoff(self, domain: Optional[str], retry_after: Optional[str] = None):
+        """Pause a domain after a 429/503, honoring Retry-After when given"""
+        if not domain:
+            return
+        state = self._state(domain)
+        state.backoffs += 1
+        state.rate_factor = max(settings.RATE_LIMIT_MIN_FACTOR, state.rate_factor / 2)
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = settings.RATE_LIMIT_BACKOFF * 2 ** (state.backoffs - 1)
+        delay = min(delay, settings.RATE_LIMIT_MAX_BACKOFF)
+        state.blocked_until = time.monotonic() + delay
+        state.tokens = 0
+        try:
+            await self.redis.set(
+                f"{self.block_prefix}{domain}", 1, px=max(1, int(delay * 1000))
+            )
+        except Exception as e:
+            logger.error(f"Error setting backoff for {domain}: {str(e)}")
+
+    def record_success(self, domain: Optional[str]):
+        """Recover the domain's rate gradually after successful requests"""
+        if not domain:
+            return
+        state = self._state(domain)
+        state.backoffs = 0
+        if state.rate_factor < 1.0:
+            state.rate_factor = min(1.0, state.rate_factor + 0.05)
@@ -0,0 +1,50 @@
+from typing import Any, Dict, Iterable, Iterator, List
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FIELDS = ("task_id", "run_id", "url", "created_at", "data")
+
+def _json_default(value: Any) -> str:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def ndjson_lines(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """One JSON document per record, one encoded block per chunk"""
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+            for record in chunk
+        ).encode("utf-8")
+
+def csv_lines(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """CSV with a fixed header; the extracted data is a JSON-encoded column"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in chunks:
+        for record in chunk:
+            created_at = record.get("created_at")
+            writer.writerow((
+                record.get("task_id"),
+                record.get("run_id"),
+                record.get("url"),
+                created_at.isoformat() if created_at else "",
+                json.dumps(record.get("data"), default=_json_default, ensure_ascii=False),
+            ))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def gzip_stream(blocks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,230 @@
+from typing import Any, Dict, Iterator, List, Optional
+from abc import ABC, abstractmethod
+from itertools import islice
+from datetime import datetime
+from functools import lru_cache
+import uuid
+import logging
+
+from sqlalchemy import func, insert, select
+
+from app.core.config import get_settings
+from app.db.session import SessionLocal
+from app.models.task_result import TaskResult
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class ResultStore(ABC):
+    """Write-once storage for scrape results, kept out of the tasks table.
+
+    Each run writes its per-URL results under a new run id, which the task
+    references via ``Task.result_ref``. Batch runs only write the URLs whose
+    results changed, so a batch task's current results are the latest row
+    per URL (``get_latest``).
+    """
+
+    @abstractmethod
+    def save(self, task_id: int, results: List[Dict[str, Any]],
+             user_id: Optional[int] = None) -> str:
+        """Store a run's results and return its run id"""
+
+    @abstractmethod
+    def get_run(self, run_id: str) -> List[Dict[str, Any]]:
+        """All results written by one run"""
+
+    @abstractmethod
+    def get_latest(self, task_id: int) -> List[Dict[str, Any]]:
+        """The most recent result stored for each of the task's URLs"""
+
+    @abstractmethod
+    def iter_results(
+        self,
+        *,
+        task_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Stream matching results in chunks of at most ``chunk_size`` records"""
+
+    @staticmethod
+    def _records(task_id: int, run_id: str, results: List[Dict[str, Any]],
+                 user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        created_at = datetime.utcnow()
+        return [
+            {
+                "task_id": task_id,
+                "user_id": user_id,
+                "run_id": run_id,
+                "url": r.get("url"),
+                "data": r.get("data"),
+                "content_hash": r.get("content_hash"),
+                "created_at": created_at,
+            }
+            for r in results
+        ]
+
+class SQLResultStore(ResultStore):
+    """Per-run result rows in the ``task_results`` table"""
+
+    def save(self, task_id: int, results: List[Dict[str, Any]],
+             user_id: Optional[int] = None) -> str:
+        run_id = uuid.uuid4().hex
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(TaskResult), self._records(task_id, run_id, results, user_id)
+            )
+            db.commit()
+        finally:
+            db.close()
+        return run_id
+
+    def get_run(self, run_id: str) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(TaskResult.url, TaskResult.data, TaskResult.created_at)
+                .where(TaskResult.run_id == run_id)
+                .order_by(TaskResult.id)
+            ).all()
+            return [dict(row._mapping) for row in rows]
+        finally:
+            db.close()
+
+    def get_latest(self, task_id: int) -> List[Dict[str, Any]]:
+        latest = (
+            select(func.max(TaskResult.id))
+            .where(TaskResult.task_id == task_id)
+            .group_by(TaskResult.url)
+        )
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(TaskResult.url, TaskResult.data, TaskResult.created_at)
+                .where(TaskResult.id.in_(latest))
+                .order_by(TaskResult.id)
+            ).all()
+            return [dict(row._mapping) for row in rows]
+        finally:
+            db.close()
+
+    def iter_results(
+        self,
+        *,
+        task_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        query = select(
+            TaskResult.task_id,
+            TaskResult.run_id,
+            TaskResult.url,
+            TaskResult.data,
+            TaskResult.created_at,
+        ).order_by(TaskResult.id)
+        if task_id is not None:
+            query = query.where(TaskResult.task_id == task_id)
+        if user_id is not None:
+            query = query.where(TaskResult.user_id == user_id)
+        if since is not None:
+            query = query.where(TaskResult.created_at >= since)
+        if until is not None:
+            query = query.where(TaskResult.created_at < until)
+
+        db = SessionLocal()
+        try:
+            # yield_per enables a server-side cursor, so only one chunk is
+            # held in memory at a time
+            rows = db.execute(query.execution_options(yield_per=chunk_size))
+            for partition in rows.partitions():
+                yield [dict(row._mapping) for row in partition]
+        finally:
+            db.close()
+
+class MongoResultStore(ResultStore):
+    """Result documents in a MongoDB collection"""
+
+    def __init__(self, url: str, database: str):
+        from pymongo import ASCENDING, DESCENDING, MongoClient
+
+        self.collection = MongoClient(url)[database]["task_results"]
+        self.collection.create_index([("run_id", ASCENDING)])
+        self.collection.create_index([("task_id", ASCENDING), ("created_at", ASCENDING)])
+        self.collection.create_index(
+            [("task_id", ASCENDING), ("url", ASCENDING), ("_id", DESCENDING)]
+        )
+        self.collection.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+
+    def save(self, task_id: int, results: List[Dict[str, Any]],
+             user_id: Optional[int] = None) -> str:
+        run_id = uuid.uuid4().hex
+        records = self._records(task_id, run_id, results, user_id)
+        if records:
+            self.collection.insert_many(records, ordered=False)
+        return run_id
+
+    def get_run(self, run_id: str) -> List[Dict[str, Any]]:
+        return list(self.collection.find(
+            {"run_id": run_id}, {"_id": 0, "url": 1, "data": 1, "created_at": 1}
+        ))
+
+    def get_latest(self, task_id: int) -> List[Dict[str, Any]]:
+        return list(self.collection.aggregate([
+            {"$match": {"task_id": task_id}},
+            {"$sort": {"url": 1, "_id": -1}},
+            {"$group": {
+                "_id": "$url",
+                "last_id": {"$first": "$_id"},
+                "data": {"$first": "$data"},
+                "created_at": {"$first": "$created_at"},
+            }},
+            {"$sort": {"last_id": 1}},
+            {"$project": {"_id": 0, "url": "$_id", "data": 1, "created_at": 1}},
+        ]))
+
+    def iter_results(
+        self,
+        *,
+        task_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        query: Dict[str, Any] = {}
+        if task_id is not None:
+            query["task_id"] = task_id
+        if user_id is not None:
+            query["user_id"] = user_id
+        if since is not None or until is not None:
+            query["created_at"] = {}
+            if since is not None:
+                query["created_at"]["$gte"] = since
+            if until is not None:
+                query["created_at"]["$lt"] = until
+
+        cursor = self.collection.find(
+            query,
+            {"_id": 0, "task_id": 1, "run_id": 1, "url": 1, "data": 1, "created_at": 1}
+        ).sort("_id").batch_size(chunk_size)
+        try:
+            while True:
+                chunk = list(islice(cursor, chunk_size))
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+@lru_cache()
+def get_result_store() -> ResultStore:
+    if settings.RESULT_STORE_BACKEND == "mongo":
+        return MongoResultStore(settings.MONGO_URL, settings.MONGO_DATABASE)
+    if settings.RESULT_STORE_BACKEND == "sql":
+        return SQLResultStore()
+    raise ValueError(f"Unknown result store backend: {settings.RESULT_STORE_BACKEND}")
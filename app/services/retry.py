@@ -0,0 +1,86 @@
+from typing import Optional
+import asyncio
+import enum
+import random
+import socket
+
+import aiohttp
+
+class ErrorKind(str, enum.Enum):
+    TIMEOUT = "timeout"
+    DNS = "dns"
+    CONNECTION = "connection"
+    PROXY = "proxy"
+    RATE_LIMITED = "rate_limited"
+    SERVER = "server"
+    CLIENT = "client"
+    TOO_LARGE = "too_large"
+    CIRCUIT_OPEN = "circuit_open"
+    DEADLINE = "deadline"
+    OTHER = "other"
+
+# Failures worth another attempt; the rest will fail the same way again
+RETRYABLE_KINDS = frozenset({
+    ErrorKind.TIMEOUT,
+    ErrorKind.CONNECTION,
+    ErrorKind.PROXY,
+    ErrorKind.RATE_LIMITED,
+    ErrorKind.SERVER,
+    ErrorKind.CIRCUIT_OPEN,
+})
+
+# Retryable, but only after a wait the target dictates, so not in-process
+DEFERRED_KINDS = frozenset({ErrorKind.RATE_LIMITED, ErrorKind.CIRCUIT_OPEN})
+
+# Failures that suggest the host itself is down
+HOST_KINDS = frozenset({ErrorKind.TIMEOUT, ErrorKind.CONNECTION, ErrorKind.DNS,
+                        ErrorKind.SERVER})
+
+# Failures that may be the proxy's fault, so the next attempt uses another one
+PROXY_KINDS = frozenset({ErrorKind.TIMEOUT, ErrorKind.CONNECTION, ErrorKind.PROXY})
+
+def classify_status(status: int) -> ErrorKind:
+    """Classify an HTTP error status"""
+    if status == 429:
+        return ErrorKind.RATE_LIMITED
+    if status == 407:
+        return ErrorKind.PROXY
+    if status == 408:
+        return ErrorKind.TIMEOUT
+    if status >= 500 and status not in (501, 505):
+        return ErrorKind.SERVER
+    return ErrorKind.CLIENT
+
+def classify_exception(exc: BaseException) -> ErrorKind:
+    """Classify an exception raised while fetching"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return ErrorKind.TIMEOUT
+    if isinstance(exc, (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError)):
+        return ErrorKind.PROXY
+    if isinstance(exc, aiohttp.ClientConnectorError) and isinstance(exc.os_error, socket.gaierror):
+        # A temporary resolver failure is worth retrying, an unknown host is not
+        if exc.os_error.errno == socket.EAI_AGAIN:
+            return ErrorKind.CONNECTION
+        return ErrorKind.DNS
+    if isinstance(exc, (aiohttp.InvalidURL, aiohttp.TooManyRedirects)):
+        return ErrorKind.CLIENT
+    if isinstance(exc, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return ErrorKind.CONNECTION
+    return ErrorKind.OTHER
+
+def is_retryable(kind: Optional[str]) -> bool:
+    return kind is not None and ErrorKind(kind) in RETRYABLE_KINDS
+
+def backoff_delay(attempt: int, base: float, cap: float,
+                  retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with equal jitter for the given zero-based attempt.
+
+    Half of the exponential delay is kept and the other half randomized, so
+    retries spread out without collapsing to zero. A server-supplied
+    ``retry_after`` is honored as a lower bound.
+    """
+    delay = min(cap, base * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
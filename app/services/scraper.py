@@ -1,20 +1,133 @@
 import aiohttp
 import asyncio
-from typing import Dict, Optional, Any
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
 from fake_useragent import UserAgent
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
 import logging
+from urllib.parse import urlparse
 
 from app.core.config import get_settings
+from app.db.redis import get_redis
 from app.services.proxy_manager import ProxyManager
+from app.services.http_cache import HTTPCache
+from app.services.rate_limiter import RateLimiter, parse_retry_after
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.cookie_manager import CookieManager
+from app.services.retry import (
+    DEFERRED_KINDS, HOST_KINDS, PROXY_KINDS, ErrorKind,
+    backoff_delay, classify_exception, classify_status, is_retryable
+)
+from app.services.deduplicator import fingerprint
+from app.services.extractor import StopMatcher, get_extraction_plan, parse_and_extract
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "application/xml", "text/xml")
+
+def build_timeout(config: Optional[Dict[str, Any]] = None) -> aiohttp.ClientTimeout:
+    """Per-attempt timeouts from ``config["timeout"]``: either total seconds
+    or a dict with any of ``connect``, ``sock_read`` and ``total``"""
+    value = (config or {}).get("timeout") or {}
+    if isinstance(value, (int, float)):
+        value = {"total": value}
+    return aiohttp.ClientTimeout(
+        total=value.get("total", settings.FETCH_TOTAL_TIMEOUT),
+        connect=value.get("connect", settings.FETCH_CONNECT_TIMEOUT),
+        sock_read=value.get("sock_read", settings.FETCH_SOCK_READ_TIMEOUT),
+    )
+
+def get_deadline(config: Optional[Dict[str, Any]] = None) -> float:
+    """Event loop time by which a run must finish, from ``config["deadline"]``
+    seconds or ``DEFAULT_TASK_TIMEOUT``"""
+    seconds = (config or {}).get("deadline", settings.DEFAULT_TASK_TIMEOUT)
+    return asyncio.get_running_loop().time() + seconds
+
+def decode_html(body: bytes, charset: Optional[str] = None) -> str:
+    """Decode an HTML body using the Content-Type charset, or, when it is
+    missing or unknown, the encoding declared in the document (BOM, XML
+    declaration or ``<meta>``)"""
+    if charset:
+        try:
+            return body.decode(charset, errors="replace")
+        except LookupError:
+            pass
+    markup = UnicodeDammit(body, is_html=True).unicode_markup
+    return markup if markup is not None else body.decode("utf-8", errors="replace")
+
+def extraction_fingerprint(config: Dict[str, Any]) -> str:
+    """Hash of the settings that decide what is extracted from a page"""
+    return fingerprint({"selectors": config.get("selectors", {}),
+                        "parser": config.get("parser")})
+
+def deadline_exceeded(url: str, stage: str) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": f"Deadline exceeded during {stage}",
+        "error_kind": ErrorKind.DEADLINE,
+        "url": url
+    }
+
 class Scraper:
     def __init__(self):
         self.ua = UserAgent()
         self.proxy_manager = ProxyManager()
+        self.http_cache = HTTPCache(get_redis())
+        self.rate_limiter = RateLimiter(get_redis())
+        self.circuit_breaker = CircuitBreaker(get_redis())
+        self.cookie_manager = CookieManager(get_redis())
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._executor: Optional[Executor] = None
+        
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.HTTP_POOL_LIMIT,
+                limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            )
+            # Fetches run in their own short-lived sessions on this pool
+            # (see ``fetch_session``), so this jar never holds cookies
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+        
+    async def fetch_session(self) -> aiohttp.ClientSession:
+        """A session on the shared pool with a cookie jar of its own.
+        
+        Cookies set along a fetch's redirect chain are sent on the
+        following hops but never reach other fetches.
+        """
+        shared = await self.get_session()
+        return aiohttp.ClientSession(
+            connector=shared.connector,
+            connector_owner=False,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+        )
+        
+    async def close(self):
+        """Close the shared session and its connection pool"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            
+    def get_executor(self) -> Optional[Executor]:
+        """Get the executor used for CPU-bound parsing, if any"""
+        if self._executor is None:
+            if settings.PARSER_EXECUTOR == "process":
+                # Requires a non-daemonic worker process (e.g. --pool=threads)
+                self._executor = ProcessPoolExecutor(max_workers=settings.PARSER_WORKERS)
+            elif settings.PARSER_EXECUTOR == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=settings.PARSER_WORKERS)
+        return self._executor
         
     async def get_headers(self, custom_headers: Optional[Dict] = None) -> Dict:
         """Generate headers with random User-Agent"""
@@ -30,22 +143,155 @@ class Scraper:
         
     async def fetch(self, url: str, headers: Optional[Dict] = None, 
                    cookies: Optional[Dict] = None, proxy: Optional[str] = None,
-                   timeout: int = 30) -> Dict[str, Any]:
-        """Fetch URL with retry mechanism and proxy support"""
+                   timeout: Optional[aiohttp.ClientTimeout] = None,
+                   max_bytes: Optional[int] = None,
+                   stop_after: Optional[str] = None,
+                   deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Fetch URL with retry mechanism and proxy support.
+        
+        The body is streamed in chunks and capped at ``max_bytes``. When
+        ``stop_after`` is a CSS selector, reading stops as soon as a matching
+        element has been received. Non-HTML bodies are returned undecoded
+        under ``body`` with ``content`` set to None. A 304 reply to a
+        conditional request is returned with ``not_modified`` set.
+        
+        Failures carry an ``error_kind``. Transient ones are retried up to
+        ``FETCH_RETRIES`` times with jittered backoff, each time through a
+        different managed proxy when the proxy may be at fault. Rate limiting
+        and open circuits are not retried here; ``retry_after`` is passed up
+        to the caller.
+        
+        ``timeout`` bounds each attempt (see ``build_timeout``). ``deadline``
+        is an event loop time bounding all attempts, backoff included; once
+        it passes the fetch is abandoned with ``error_kind`` ``deadline``.
+        
+        Cookies saved for the host with ``CookieManager`` are sent along
+        with ``cookies``, which take precedence.
+        """
+        timeout = timeout or build_timeout()
+        domain = urlparse(url).hostname
+        stored_cookies = await self.cookie_manager.get_cookies(domain) if domain else None
+        if stored_cookies:
+            cookies = {**stored_cookies, **(cookies or {})}
+        loop = asyncio.get_running_loop()
+        for attempt in range(settings.FETCH_RETRIES + 1):
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return deadline_exceeded(url, "fetch")
+            try:
+                result = await asyncio.wait_for(self._fetch_once(
+                    url, headers=headers, cookies=cookies, proxy=proxy, timeout=timeout,
+                    max_bytes=max_bytes, stop_after=stop_after
+                ), remaining)
+            except asyncio.TimeoutError:
+                return deadline_exceeded(url, "fetch")
+            kind = result.get("error_kind")
+            if (result["success"] or kind in DEFERRED_KINDS
+                    or not is_retryable(kind) or attempt == settings.FETCH_RETRIES):
+                return result
+            delay = backoff_delay(
+                attempt, settings.FETCH_RETRY_BACKOFF, settings.FETCH_RETRY_MAX_BACKOFF
+            )
+            if deadline is not None and loop.time() + delay >= deadline:
+                return result
+            await asyncio.sleep(delay)
+        return result
+        
+    async def _fetch_once(self, url: str, headers: Optional[Dict] = None,
+                         cookies: Optional[Dict] = None, proxy: Optional[str] = None,
+                         timeout: Optional[aiohttp.ClientTimeout] = None,
+                         max_bytes: Optional[int] = None,
+                         stop_after: Optional[str] = None) -> Dict[str, Any]:
+        """A single fetch attempt, see ``fetch``"""
+        max_bytes = max_bytes or settings.FETCH_MAX_BYTES
+        domain = urlparse(url).hostname
+        managed_proxy = None
+        loop = asyncio.get_running_loop()
+        
+        # Fail fast instead of tying up a slot on a host that is down
+        wait = await self.circuit_breaker.allow(
+            domain, probe_timeout=timeout.total or settings.FETCH_TOTAL_TIMEOUT
+        )
+        if wait > 0:
+            return {
+                "success": False,
+                "error": f"Circuit open for {domain}",
+                "error_kind": ErrorKind.CIRCUIT_OPEN,
+                "retry_after": wait,
+                "url": url
+            }
+            
         try:
-            async with aiohttp.ClientSession(cookies=cookies) as session:
-                headers = await self.get_headers(headers)
-                proxy = proxy or await self.proxy_manager.get_proxy()
-                
-                async with session.get(url, headers=headers, proxy=proxy, 
-                                    timeout=timeout) as response:
+            headers = await self.get_headers(headers)
+            
+            async with self.rate_limiter.limit(domain):
+                if proxy is None:
+                    proxy = managed_proxy = await self.proxy_manager.get_proxy(domain)
+                started = loop.time()
+                session = await self.fetch_session()
+                async with session, session.get(url, headers=headers, cookies=cookies,
+                                                proxy=proxy, timeout=timeout) as response:
+                    if managed_proxy and response.status == 407:
+                        self.proxy_manager.report_result(managed_proxy, False, domain=domain)
+                        managed_proxy = None
+                    elif managed_proxy:
+                        self.proxy_manager.report_result(
+                            managed_proxy, True, loop.time() - started, domain
+                        )
+                        managed_proxy = None
+                    if classify_status(response.status) == ErrorKind.SERVER:
+                        await self.circuit_breaker.record_failure(domain)
+                    else:
+                        await self.circuit_breaker.record_success(domain)
+                    if response.status in (429, 503):
+                        await self.rate_limiter.backoff(
+                            domain, response.headers.get("Retry-After")
+                        )
+                    elif response.status < 400:
+                        self.rate_limiter.record_success(domain)
                     if response.status == 200:
-                        content = await response.text()
+                        if response.content_length and response.content_length > max_bytes:
+                            return {
+                                "success": False,
+                                "status": response.status,
+                                "error": f"Response too large ({response.content_length} bytes)",
+                                "error_kind": ErrorKind.TOO_LARGE,
+                                "url": str(response.url)
+                            }
+                        is_html = response.content_type in HTML_CONTENT_TYPES
+                        body, stopped_early = await self._read_body(
+                            response, max_bytes, stop_after if is_html else None
+                        )
+                        if body is None:
+                            return {
+                                "success": False,
+                                "status": response.status,
+                                "error": f"Response exceeds {max_bytes} bytes",
+                                "error_kind": ErrorKind.TOO_LARGE,
+                                "url": str(response.url)
+                            }
+                        if is_html:
+                            content = decode_html(body, response.charset)
+                            body = None
+                        else:
+                            content = None
                         return {
                             "success": True,
                             "status": response.status,
                             "content": content,
-                            "headers": dict(response.headers),
+                            "body": body,
+                            "content_type": response.content_type,
+                            "stopped_early": stopped_early,
+                            "headers": response.headers,
+                            "url": str(response.url)
+                        }
+                    elif response.status == 304:
+                        return {
+                            "success": True,
+                            "status": response.status,
+                            "not_modified": True,
+                            "content": None,
+                            "headers": response.headers,
                             "url": str(response.url)
                         }
                     else:
@@ -53,23 +299,208 @@ class Scraper:
                             "success": False,
                             "status": response.status,
                             "error": f"HTTP {response.status}",
+                            "error_kind": classify_status(response.status),
+                            "retry_after": parse_retry_after(
+                                response.headers.get("Retry-After")
+                            ),
                             "url": str(response.url)
                         }
-                        
+                    
+        except asyncio.CancelledError:
+            # Abandoned at the deadline; the proxy is not to blame
+            if managed_proxy:
+                self.proxy_manager.release(managed_proxy)
+            raise
         except asyncio.TimeoutError:
-            return {"success": False, "error": "Request timeout", "url": url}
+            if managed_proxy:
+                self.proxy_manager.report_result(managed_proxy, False, domain=domain)
+            await self.circuit_breaker.record_failure(domain)
+            return {
+                "success": False,
+                "error": "Request timeout",
+                "error_kind": ErrorKind.TIMEOUT,
+                "url": url
+            }
         except Exception as e:
+            kind = classify_exception(e)
+            if kind in HOST_KINDS:
+                await self.circuit_breaker.record_failure(domain)
+            if managed_proxy and kind in PROXY_KINDS:
+                self.proxy_manager.report_result(managed_proxy, False, domain=domain)
+            elif managed_proxy:
+                # Not the proxy's fault, so its score is left alone
+                self.proxy_manager.release(managed_proxy)
             logger.error(f"Error fetching {url}: {str(e)}")
-            return {"success": False, "error": str(e), "url": url}
+            return {"success": False, "error": str(e), "error_kind": kind, "url": url}
+            
+    async def _read_body(self, response: aiohttp.ClientResponse, max_bytes: int,
+                        stop_after: Optional[str] = None) -> Tuple[Optional[bytes], bool]:
+        """Read the body in chunks, returning (body, stopped_early).
+        
+        The body is None when it grows past ``max_bytes``.
+        """
+        matcher = StopMatcher(stop_after) if stop_after else None
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(settings.FETCH_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                return None, False
+            chunks.append(chunk)
+            if matcher is not None and matcher.feed(chunk):
+                return b"".join(chunks), True
+        return b"".join(chunks), False
             
     async def parse(self, content: str, parser: str = "html.parser") -> BeautifulSoup:
         """Parse HTML content using BeautifulSoup"""
         return BeautifulSoup(content, parser)
         
-    async def extract_data(self, soup: BeautifulSoup, selectors: Dict[str, str]) -> Dict[str, Any]:
+    async def extract_data(self, soup: BeautifulSoup, selectors: Dict[str, Any]) -> Dict[str, Any]:
         """Extract data from parsed HTML using CSS selectors"""
-        result = {}
-        for key, selector in selectors.items():
-            elements = soup.select(selector)
-            result[key] = [el.get_text(strip=True) for el in elements]
-        return result
+        return get_extraction_plan(selectors).extract(soup)
+        
+    async def parse_and_extract(self, content: str, selectors: Dict[str, Any],
+                               parser: Optional[str] = None) -> Dict[str, Any]:
+        """Parse and extract off the event loop, returning only the data"""
+        parser = parser or settings.DEFAULT_PARSER
+        executor = self.get_executor()
+        if executor is None:
+            return parse_and_extract(content, selectors, parser)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, parse_and_extract, content, selectors, parser
+        )
+        
+    async def scrape(self, url: str, config: Optional[Dict[str, Any]] = None,
+                    headers: Optional[Dict] = None,
+                    cookies: Optional[Dict] = None,
+                    reuse_cached_body: bool = False,
+                    deadline: Optional[float] = None,
+                    cache_scope: Optional[str] = None) -> Dict[str, Any]:
+        """Run fetch, parse and extract for a single URL.
+        
+        Unless disabled with ``config["http_cache"]``, the request is made
+        conditional on the cached validators. A 304 returns ``not_modified``
+        without data so the caller can keep its previous result, or, with
+        ``reuse_cached_body``, extracts from the body cached via
+        ``config["cache_body"]``. A caller with no previous result passes
+        ``reuse_cached_body``; the validators are then only sent when the
+        cached entry has a body to extract from.
+        
+        Cache entries are kept per ``cache_scope`` (e.g. the task id), as a
+        304 is only safe for the caller that stored the matching result. New
+        validators are not saved here but returned under ``http_cache``; pass
+        the result to ``save_http_cache`` once it has been stored.
+        
+        Everything, retries and extraction included, has to finish by
+        ``deadline`` (default: ``get_deadline(config)``).
+        """
+        config = config or {}
+        if deadline is None:
+            deadline = get_deadline(config)
+        use_cache = settings.HTTP_CACHE_ENABLED and config.get("http_cache", True)
+        # Validators and content hashes are only comparable under the same
+        # extraction config; an edited config must re-extract unchanged pages
+        variant = extraction_fingerprint(config)
+        cache_variant = f"{cache_scope}:{variant}" if cache_scope else variant
+        entry = await self.http_cache.get(url, cache_variant) if use_cache else None
+        if entry and reuse_cached_body and entry.get("content") is None:
+            # A 304 would leave nothing to extract from
+            entry = None
+        if entry:
+            headers = {**(headers or {}), **self.http_cache.get_validators(entry)}
+            
+        result = await self.fetch(
+            url, headers=headers, cookies=cookies,
+            timeout=build_timeout(config),
+            max_bytes=config.get("max_bytes"),
+            stop_after=config.get("stop_after"),
+            deadline=deadline
+        )
+        if not result["success"]:
+            return result
+            
+        content = result["content"]
+        new_entry = None
+        if result.get("not_modified"):
+            content = entry.get("content") if reuse_cached_body else None
+            if content is None:
+                return {
+                    "success": True,
+                    "status": result["status"],
+                    "not_modified": True,
+                    "data": None,
+                    "url": result["url"]
+                }
+        elif use_cache and content is not None and not result["stopped_early"]:
+            new_entry = self.http_cache.build_entry(
+                result["headers"], content if config.get("cache_body") else None
+            )
+            
+        if content is None:
+            data = {}
+        else:
+            # The executor job cannot be interrupted, but the run stops waiting for it
+            remaining = deadline - asyncio.get_running_loop().time()
+            try:
+                data = await asyncio.wait_for(self.parse_and_extract(
+                    content, config.get("selectors", {}), config.get("parser")
+                ), max(remaining, 0))
+            except asyncio.TimeoutError:
+                return deadline_exceeded(url, "extraction")
+        return {
+            "success": True,
+            "status": result["status"],
+            "data": data,
+            "content_hash": fingerprint(variant + content) if content is not None else None,
+            "http_cache": {
+                "url": url, "variant": cache_variant, "entry": new_entry
+            } if new_entry else None,
+            "url": result["url"]
+        }
+        
+    async def save_http_cache(self, results: List[Dict[str, Any]]):
+        """Save the validators returned by ``scrape`` for stored results"""
+        for r in results:
+            pending = r.get("http_cache")
+            if pending:
+                await self.http_cache.save(
+                    pending["url"], pending["entry"], variant=pending["variant"]
+                )
+        
+    async def scrape_many(self, urls: List[str],
+                         config: Optional[Dict[str, Any]] = None,
+                         headers: Optional[Dict] = None,
+                         cookies: Optional[Dict] = None,
+                         concurrency: Optional[int] = None,
+                         cache_scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Scrape many URLs concurrently with a bounded number in flight.
+        
+        There is no per-URL result to fall back on, so unchanged pages are
+        re-extracted from the cached body when one is available. Each URL
+        gets its own deadline (``config["deadline"]``) from when it starts,
+        so large batches throttled by the rate limiter do not time out as a
+        whole. ``config["batch_deadline"]`` seconds, when set, additionally
+        bound the whole batch.
+        """
+        config = config or {}
+        semaphore = asyncio.Semaphore(concurrency or settings.CONCURRENT_TASKS)
+        deadline = None
+        if config.get("batch_deadline") is not None:
+            deadline = asyncio.get_running_loop().time() + config["batch_deadline"]
+        
+        async def _scrape(url: str) -> Dict[str, Any]:
+            async with semaphore:
+                url_deadline = get_deadline(config)
+                if deadline is not None:
+                    url_deadline = min(url_deadline, deadline)
+                try:
+                    return await self.scrape(url, config, headers, cookies,
+                                             reuse_cached_body=True,
+                                             deadline=url_deadline,
+                                             cache_scope=cache_scope)
+                except Exception as e:
+                    logger.error(f"Error scraping {url}: {str(e)}")
+                    return {"success": False, "error": str(e), "url": url}
+                    
+        return await asyncio.gather(*(_scrape(url) for url in urls))
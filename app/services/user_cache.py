@@ -0,0 +1,158 @@
+from typing import Any, Dict, Optional, Set
+from collections import OrderedDict
+import json
+import time
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import get_settings
+from app.db.redis import get_redis, get_sync_redis
+from app.models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class UserPrincipal:
+    """The fields of a User needed to authorize a request"""
+    __slots__ = ("id", "email", "username", "role", "is_active", "is_superuser",
+                 "daily_task_limit")
+
+    def __init__(self, **fields: Any):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(**{name: getattr(user, name) for name in cls.__slots__})
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if data["role"] is not None:
+            data["role"] = UserRole(data["role"]).value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserPrincipal":
+        if data.get("role") is not None:
+            data = {**data, "role": UserRole(data["role"])}
+        return cls(**data)
+
+class UserCache:
+    """Short-TTL LRU of user principals, optionally backed by Redis so
+    several API processes share lookups.
+
+    Invalidation drops the local entry and the Redis one once the change
+    is committed; other processes may keep their local copy for at most
+    ``USER_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, ttl: int, maxsize: int, use_redis: bool = False):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.use_redis = use_redis
+        self.key_prefix = "user_principal:"
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+    async def get(self, user_id: int) -> Optional[UserPrincipal]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires, principal = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return principal
+            del self._entries[user_id]
+
+        if self.use_redis:
+            try:
+                data = await get_redis().get(f"{self.key_prefix}{user_id}")
+                if data:
+                    principal = UserPrincipal.from_dict(json.loads(data))
+                    self._store(user_id, principal)
+                    return principal
+            except Exception as e:
+                logger.error(f"Error reading cached user {user_id}: {str(e)}")
+        return None
+
+    def _store(self, user_id: int, principal: UserPrincipal):
+        self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def set(self, principal: UserPrincipal):
+        self._store(principal.id, principal)
+        if self.use_redis:
+            try:
+                await get_redis().set(
+                    f"{self.key_prefix}{principal.id}",
+                    json.dumps(principal.to_dict()),
+                    ex=self.ttl
+                )
+            except Exception as e:
+                logger.error(f"Error caching user {principal.id}: {str(e)}")
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+        if self.use_redis:
+            try:
+                get_sync_redis().delete(f"{self.key_prefix}{user_id}")
+            except Exception as e:
+                logger.error(f"Error invalidating cached user {user_id}: {str(e)}")
+
+    def invalidate_all(self):
+        """Drop every cached principal, e.g. after a bulk UPDATE of users"""
+        self._entries.clear()
+        if self.use_redis:
+            try:
+                redis = get_sync_redis()
+                keys = list(redis.scan_iter(match=f"{self.key_prefix}*", count=500))
+                if keys:
+                    redis.delete(*keys)
+            except Exception as e:
+                logger.error(f"Error invalidating cached users: {str(e)}")
+
+user_cache = UserCache(
+    ttl=settings.USER_CACHE_TTL,
+    maxsize=settings.USER_CACHE_SIZE,
+    use_redis=settings.USER_CACHE_REDIS,
+)
+
+# Changed users are collected per session and dropped from the cache only
+# after commit; invalidating at flush would let a concurrent request re-cache
+# the old row before the transaction is visible.
+PENDING_KEY = "invalidate_users"
+
+def _pending(session: Session) -> Set[Optional[int]]:
+    return session.info.setdefault(PENDING_KEY, set())
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _mark_changed_user(mapper, connection, target: User):
+    session = object_session(target)
+    if session is not None:
+        _pending(session).add(target.id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_user_change(orm_execute_state):
+    # Bulk UPDATE/DELETE statements skip the mapper events and may touch
+    # any user, so the whole cache is dropped (marked by None)
+    if ((orm_execute_state.is_update or orm_execute_state.is_delete)
+            and any(m.class_ is User for m in orm_execute_state.all_mappers)):
+        _pending(orm_execute_state.session).add(None)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    if None in pending:
+        user_cache.invalidate_all()
+        return
+    for user_id in pending:
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_users(session: Session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,55 @@
+from typing import Any, Dict, Iterable, List, Optional
+from collections import OrderedDict, defaultdict
+from itertools import chain, zip_longest
+from celery.canvas import Signature
+
+from app.worker import celery_app, PRIORITY_QUEUES
+from app.models.task import TaskPriority
+
+EXECUTE_TASK = "app.tasks.scraper_tasks.execute_scraping_task"
+EXECUTE_BATCH_TASK = "app.tasks.scraper_tasks.execute_batch_scraping_task"
+
+def task_signature(task_id: int, config: Optional[Dict[str, Any]] = None,
+                   priority: Optional[TaskPriority] = None) -> Signature:
+    """按任务配置选择单URL或批量爬虫任务（按名称引用，API进程无需导入爬虫代码），
+    并按优先级投递到对应队列"""
+    name = EXECUTE_BATCH_TASK if (config or {}).get("urls") else EXECUTE_TASK
+    queue = PRIORITY_QUEUES[TaskPriority(priority or TaskPriority.MEDIUM)]
+    return celery_app.signature(name, args=(task_id,), queue=queue)
+
+def fair_order(rows: Iterable[Any]) -> List[Any]:
+    """按优先级从高到低排列；同一优先级内按用户轮流排列，
+    避免某个用户的大批量任务把其他用户的任务压在队列尾部"""
+    by_priority: Dict[int, "OrderedDict[int, List[Any]]"] = defaultdict(OrderedDict)
+    for row in rows:
+        by_priority[row.priority].setdefault(row.user_id, []).append(row)
+    ordered: List[Any] = []
+    for priority in sorted(by_priority, reverse=True):
+        rounds = zip_longest(*by_priority[priority].values())
+        ordered.extend(row for row in chain.from_iterable(rounds) if row is not None)
+    return ordered
+
+class DispatchError(Exception):
+    """投递中途失败；sent_ids 是已经进入队列的任务，其余任务需要退回"""
+
+    def __init__(self, sent_ids: List[int]):
+        super().__init__(f"Dispatch failed after {len(sent_ids)} tasks")
+        self.sent_ids = sent_ids
+
+def dispatch_tasks(rows: Iterable[Any]) -> int:
+    """把 (id, priority, user_id, config) 行投递到队列，返回投递数量。
+
+    与 group.apply_async 一样共用一个生产者连接，但逐条记录已发送的任务：
+    中途失败时抛出 DispatchError，调用方只退回未发送的任务，避免重复执行。
+    """
+    sent: List[int] = []
+    try:
+        with celery_app.producer_or_acquire() as producer:
+            for row in fair_order(rows):
+                task_signature(row.id, row.config, row.priority).apply_async(
+                    producer=producer
+                )
+                sent.append(row.id)
+    except Exception as e:
+        raise DispatchError(sent) from e
+    return len(sent)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+class LoopRunner:
+    """每个工作进程一个常驻事件循环，运行在独立线程中
+
+    Celery任务线程通过 run() 把协程交给该循环并阻塞等待结果，
+    因此使用 threads 池时同一进程内可以同时有多个抓取在进行；
+    数据库状态更新仍在任务线程中同步执行，不会阻塞事件循环。
+    同时在循环中运行的协程数量受 max_in_flight 限制。
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        # 按进程惰性启动：prefork父进程中创建的线程在fork后不会存在
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(loop)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="scraper-event-loop", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    async def _bounded(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        # 超时从取得并发名额后才开始计算，排队等待名额的时间不计入
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(coro, timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Coroutine did not finish within {timeout}s") from None
+
+    def submit(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Future:
+        """把协程提交到事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._bounded(coro, timeout), self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """在事件循环中运行协程并等待结果（不可在循环线程内调用）。
+
+        timeout 只限制协程开始运行后的时间：循环已满（max_in_flight）时
+        排队等待不算超时，避免尚未开始的任务因超时失败且不被重试。
+        超时后取消协程并抛出 TimeoutError
+        """
+        return self.submit(coro, timeout).result()
+
+    def stop(self, timeout: float = 10.0):
+        """停止事件循环并等待线程退出"""
+        if self._loop is None or self._pid != os.getpid():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+        self._loop = None
@@ -1,23 +1,129 @@
 import asyncio
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
 from celery import Task
-from datetime import datetime
+from celery.exceptions import Retry
+from celery.signals import worker_process_shutdown, worker_shutdown
+from datetime import datetime, timedelta
+from collections import defaultdict
 from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
 
 from app.worker import celery_app
+from app.tasks.dispatch import DispatchError, dispatch_tasks
+from app.tasks.event_loop import LoopRunner
+from app.core.config import get_settings
 from app.db.session import SessionLocal
+from app.db.redis import get_redis, get_sync_redis
 from app.services.scraper import Scraper
+from app.services.deduplicator import Deduplicator
+from app.services.cron import CronSchedule
+from app.services.result_store import get_result_store
+from app.services.retry import backoff_delay, is_retryable
 from app.models.task import TaskStatus
-from app.crud.crud_task import task as crud_task
+from app.crud.crud_task import task as crud_task, RESCHEDULABLE_STATUSES
+
+settings = get_settings()
+cron_schedule = CronSchedule(get_sync_redis())
+runner = LoopRunner(settings.WORKER_MAX_IN_FLIGHT)
+DEADLINE_GRACE = 5.0  # 秒
+
+def update_status(db: Session, *, task_id: int, status: TaskStatus, **kwargs):
+    """更新任务状态，并把周期任务的下次执行时间写入调度时间轮"""
+    task = crud_task.update_task_status(db, task_id=task_id, status=status, **kwargs)
+    if task is not None and task.next_run is not None and status in RESCHEDULABLE_STATUSES:
+        cron_schedule.add(task.id, task.next_run)
+    return task
+
+def run_timeout(config: Dict[str, Any], key: str = "deadline") -> Optional[float]:
+    """抓取协程自身在截止时间（config[key]）处结束，这里多留一点余量作为兜底"""
+    if key == "deadline":
+        return config.get(key, settings.DEFAULT_TASK_TIMEOUT) + DEADLINE_GRACE
+    if config.get(key) is None:
+        return None
+    return config[key] + DEADLINE_GRACE
 
 class ScraperTask(Task):
     _scraper = None
+    _deduplicator = None
+    _lock = threading.Lock()
 
     @property
     def scraper(self) -> Scraper:
-        if self._scraper is None:
-            self._scraper = Scraper()
-        return self._scraper
+        # 挂在基类上，使同一进程内的所有爬虫任务共用一个连接池
+        if ScraperTask._scraper is None:
+            with ScraperTask._lock:
+                if ScraperTask._scraper is None:
+                    ScraperTask._scraper = Scraper()
+        return ScraperTask._scraper
+
+    @property
+    def deduplicator(self) -> Deduplicator:
+        if ScraperTask._deduplicator is None:
+            with ScraperTask._lock:
+                if ScraperTask._deduplicator is None:
+                    ScraperTask._deduplicator = Deduplicator(get_redis())
+        return ScraperTask._deduplicator
+
+    def check_duplicates(self, items: List[Tuple[str, Dict[str, Any]]],
+                         config: Dict[str, Any]) -> List[Tuple[bool, Optional[Dict[str, str]]]]:
+        """按任务配置在一次事件循环调用中并发检查 (键, 结果) 是否与上次相同。
+        只读不写，返回 (是否重复, 指纹)，结果保存成功后再用 commit_results 写入"""
+        async def check(key: str, result: Dict[str, Any]):
+            if (not config.get("dedup", True) or not result["success"]
+                    or result.get("not_modified")):
+                return False, None
+            return await self.deduplicator.check(
+                key,
+                result["data"],
+                content_hash=result.get("content_hash"),
+                max_distance=config.get("simhash_distance")
+            )
+
+        async def check_all():
+            return await asyncio.gather(*(check(key, result) for key, result in items))
+
+        return runner.run(check_all())
+
+    def commit_results(self, items: List[Tuple[str, Dict[str, Any]]],
+                       checks: List[Tuple[bool, Optional[Dict[str, str]]]]):
+        """结果保存成功后写入去重指纹和HTTP缓存验证器；
+        保存失败时两者都不写，下次执行会重新抓取并保存"""
+        async def commit_all():
+            await asyncio.gather(*(
+                self.deduplicator.commit(key, None if duplicate else fingerprints)
+                for (key, _), (duplicate, fingerprints) in zip(items, checks)
+                if fingerprints is not None
+            ))
+            await self.scraper.save_http_cache([result for _, result in items])
+
+        runner.run(commit_all())
+
+    def retry_transient(self, db: Session, task_id: int, result: Dict[str, Any]):
+        """瞬时错误（超时、连接、代理、限流、5xx）按指数退避加抖动重新入队，
+        永久错误或重试次数用尽时直接返回，由调用方标记失败"""
+        if not is_retryable(result.get("error_kind")) or self.request.retries >= settings.MAX_RETRIES:
+            return
+        error = result.get("error", "Unknown error")
+        if update_status(db, task_id=task_id, status=TaskStatus.QUEUED, error_message=error) is None:
+            return
+        countdown = backoff_delay(
+            self.request.retries,
+            settings.RETRY_BACKOFF,
+            settings.RETRY_MAX_BACKOFF,
+            retry_after=result.get("retry_after")
+        )
+        raise self.retry(countdown=countdown, max_retries=settings.MAX_RETRIES)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_scraper_session(**kwargs):
+    """工作进程退出时关闭共享的HTTP连接池并停止事件循环"""
+    scraper = ScraperTask._scraper
+    if scraper is not None:
+        ScraperTask._scraper = None
+        runner.run(scraper.close())
+    runner.stop()
 
 @celery_app.task(bind=True, base=ScraperTask)
 def execute_scraping_task(self, task_id: int) -> Dict[str, Any]:
@@ -29,49 +135,64 @@ def execute_scraping_task(self, task_id: int) -> Dict[str, Any]:
         if not task_obj:
             return {"success": False, "error": "Task not found"}
 
-        # 更新任务状态为运行中
-        crud_task.update_task_status(db, task_id=task_id, status=TaskStatus.RUNNING)
+        # 更新任务状态为运行中（任务已被取消或正在运行时放弃执行）
+        if update_status(db, task_id=task_id, status=TaskStatus.RUNNING) is None:
+            return {"success": False, "error": "Task is not runnable", "task_id": task_id}
 
-        # 执行爬虫任务
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(
-            self.scraper.fetch(
+        # 执行爬虫任务（抓取、解析、提取在同一次事件循环调用中完成）
+        config = task_obj.config or {}
+        result = runner.run(
+            self.scraper.scrape(
                 url=task_obj.url,
+                config=config,
                 headers=task_obj.headers,
-                cookies=task_obj.cookies
-            )
+                cookies=task_obj.cookies,
+                reuse_cached_body=task_obj.result_ref is None,
+                cache_scope=str(task_id)
+            ),
+            timeout=run_timeout(config)
         )
 
         if result["success"]:
-            # 解析数据
-            soup = loop.run_until_complete(
-                self.scraper.parse(result["content"])
-            )
-            
-            # 根据任务配置提取数据
-            data = loop.run_until_complete(
-                self.scraper.extract_data(soup, task_obj.config.get("selectors", {}))
+            # 页面未变化（304）或结果重复时沿用上一次的结果，不再写入
+            items = [(str(task_id), result)]
+            checks = self.check_duplicates(items, config)
+            duplicate = checks[0][0]
+            unchanged = duplicate or bool(result.get("not_modified"))
+
+            # 结果写入结果存储，任务行只保存引用
+            result_ref = None if unchanged else get_result_store().save(
+                task_id, [result], user_id=task_obj.user_id
             )
-            
+            # 结果保存成功后才记录指纹和验证器，否则下次会被当作重复或得到304而永远补不上结果
+            self.commit_results(items, checks)
+
             # 更新任务状态为完成
-            crud_task.update_task_status(
+            update_status(
                 db, 
                 task_id=task_id, 
-                status=TaskStatus.COMPLETED
+                status=TaskStatus.COMPLETED,
+                result_ref=result_ref,
+                schedule=task_obj.schedule
             )
             
+            # 不经Celery结果后端回传抓取数据
             return {
                 "success": True,
-                "data": data,
+                "result_ref": result_ref,
+                "not_modified": bool(result.get("not_modified")),
+                "duplicate": duplicate,
                 "task_id": task_id
             }
         else:
-            # 更新任务状态为失败
-            crud_task.update_task_status(
+            # 可恢复的错误重新入队，否则更新任务状态为失败
+            self.retry_transient(db, task_id, result)
+            update_status(
                 db,
                 task_id=task_id,
                 status=TaskStatus.FAILED,
-                error_message=result.get("error", "Unknown error")
+                error_message=result.get("error", "Unknown error"),
+                schedule=task_obj.schedule
             )
             
             return {
@@ -80,8 +201,11 @@ def execute_scraping_task(self, task_id: int) -> Dict[str, Any]:
                 "task_id": task_id
             }
     
+    except Retry:
+        raise
+
     except Exception as e:
-        crud_task.update_task_status(
+        update_status(
             db,
             task_id=task_id,
             status=TaskStatus.FAILED,
@@ -92,16 +216,113 @@ def execute_scraping_task(self, task_id: int) -> Dict[str, Any]:
     finally:
         db.close()
 
-@celery_app.task
-def check_proxies():
-    """检查代理池中的代理状态"""
+@celery_app.task(bind=True, base=ScraperTask)
+def execute_batch_scraping_task(self, task_id: int,
+                                urls: Optional[List[str]] = None) -> Dict[str, Any]:
+    """批量执行爬虫任务：在一个事件循环内并发抓取多个URL"""
     db = SessionLocal()
     try:
-        # TODO: 实现代理检查逻辑
-        pass
+        task_obj = crud_task.get(db, id=task_id)
+        if not task_obj:
+            return {"success": False, "error": "Task not found"}
+
+        config = task_obj.config or {}
+        urls = urls or config.get("urls") or [task_obj.url]
+        concurrency = config.get("concurrency", settings.CONCURRENT_TASKS)
+
+        if update_status(db, task_id=task_id, status=TaskStatus.RUNNING) is None:
+            return {"success": False, "error": "Task is not runnable", "task_id": task_id}
+
+        # 每个URL各有截止时间；整批只有在配置了 batch_deadline 时才限时
+        results = runner.run(
+            self.scraper.scrape_many(
+                urls,
+                config=config,
+                headers=task_obj.headers,
+                cookies=task_obj.cookies,
+                concurrency=concurrency,
+                cache_scope=str(task_id)
+            ),
+            timeout=run_timeout(config, "batch_deadline")
+        )
+
+        items = [(f"{task_id}:{r['url']}", r) for r in results]
+        checks = self.check_duplicates(items, config)
+        for r, (duplicate, _) in zip(results, checks):
+            if duplicate:
+                r["duplicate"] = True
+
+        succeeded = sum(1 for r in results if r["success"])
+        if succeeded:
+            # 只保存结果有变化的URL；未变化、失败或没有数据的URL沿用之前保存的行，
+            # 读取时按URL取最新一行（ResultStore.get_latest）
+            rows = [
+                r for r in results
+                if r["success"] and not r.get("duplicate") and r.get("data") is not None
+            ]
+            result_ref = get_result_store().save(
+                task_id, rows, user_id=task_obj.user_id
+            ) if rows else None
+            self.commit_results(items, checks)
+            update_status(
+                db,
+                task_id=task_id,
+                status=TaskStatus.COMPLETED,
+                result_ref=result_ref,
+                schedule=task_obj.schedule
+            )
+        else:
+            # 全部URL都是可恢复的错误时整体重试（单个URL的瞬时错误已在抓取时重试过）
+            if all(is_retryable(r.get("error_kind")) for r in results):
+                retry_after = [r["retry_after"] for r in results if r.get("retry_after")]
+                self.retry_transient(db, task_id, {
+                    "error": f"All {len(results)} URLs failed",
+                    "error_kind": results[0]["error_kind"] if results else None,
+                    "retry_after": max(retry_after) if retry_after else None,
+                })
+            update_status(
+                db,
+                task_id=task_id,
+                status=TaskStatus.FAILED,
+                error_message=f"All {len(results)} URLs failed",
+                schedule=task_obj.schedule
+            )
+
+        return {
+            "success": succeeded > 0,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "failed_urls": [r["url"] for r in results if not r["success"]],
+            "result_ref": result_ref if succeeded else None,
+            "task_id": task_id
+        }
+
+    except Retry:
+        raise
+
+    except Exception as e:
+        update_status(
+            db,
+            task_id=task_id,
+            status=TaskStatus.FAILED,
+            error_message=str(e)
+        )
+        return {"success": False, "error": str(e), "task_id": task_id}
+
     finally:
         db.close()
 
+@celery_app.task(bind=True, base=ScraperTask)
+def check_proxies(self) -> Dict[str, Any]:
+    """检查代理池中的代理状态"""
+    # 复用进程内的代理池，以便跨多次检查累计连续失败次数
+    manager = self.scraper.proxy_manager
+    runner.run(manager.update_proxies())
+    # 定时任务的周期即检查间隔，因此每次都检查全部代理
+    results = runner.run(manager.verify_proxies(force=True))
+    working = sum(1 for ok in results.values() if ok)
+    return {"checked": len(results), "working": working}
+
 @celery_app.task
 def update_cookies():
     """更新Cookie信息"""
@@ -112,17 +333,111 @@ def update_cookies():
     finally:
         db.close()
 
+def _due_batches(db: Session, capped: Set[int], held_ids: List[int]):
+    """按批认领到期任务：优先从调度时间轮取，Redis不可用时退回按主键分页扫描任务表。
+
+    capped 中用户的任务不认领（集合可在两批之间更新）；从时间轮取出的这类任务记入 held_ids。
+    """
+    last_id = 0
+    while True:
+        try:
+            due_ids = cron_schedule.pop_due(limit=settings.SCHEDULER_BATCH_SIZE)
+            if not due_ids:
+                return
+            claimed = crud_task.claim_due_tasks(
+                db, task_ids=due_ids, exclude_users=set(capped)
+            )
+            if capped and len(claimed) < len(due_ids):
+                claimed_ids = {row.id for row in claimed}
+                held_ids.extend(crud_task.filter_user_tasks(
+                    db,
+                    task_ids=[task_id for task_id in due_ids if task_id not in claimed_ids],
+                    user_ids=capped
+                ))
+        except RedisError:
+            claimed = crud_task.claim_due_tasks(
+                db, after_id=last_id, limit=settings.SCHEDULER_BATCH_SIZE,
+                exclude_users=set(capped)
+            )
+            if not claimed:
+                return
+            last_id = max(row.id for row in claimed)
+        if claimed:
+            yield claimed
+
+def _dispatch(db: Session, rows) -> int:
+    """批量投递到对应优先级的队列，失败时把未发送的任务退回待执行状态"""
+    try:
+        return dispatch_tasks(rows)
+    except DispatchError as e:
+        sent = set(e.sent_ids)
+        crud_task.release_tasks(db, task_ids=[row.id for row in rows if row.id not in sent])
+        raise
+
+@celery_app.task
+def schedule_pending_tasks() -> Dict[str, Any]:
+    """调度待执行的任务
+
+    公平分配：每个用户每轮先投递约 SCHEDULER_USER_SHARE 个任务（软上限，最多超出一批），
+    达到上限的用户不再被认领。其他用户的到期任务都已投递、且队列中没有其他用户的任务
+    在排队时，再投递这些用户剩余的任务，避免worker空闲；否则留到下一轮。
+    """
+    db = SessionLocal()
+    dispatched = 0
+    shares: Dict[int, int] = defaultdict(int)
+    capped: Set[int] = set()
+    held_ids: List[int] = []
+    try:
+        for claimed in _due_batches(db, capped, held_ids):
+            dispatched += _dispatch(db, claimed)
+            for row in claimed:
+                shares[row.user_id] += 1
+                if shares[row.user_id] >= settings.SCHEDULER_USER_SHARE:
+                    capped.add(row.user_id)
+
+        if not capped:
+            return {"dispatched": dispatched, "held": 0}
+
+        if crud_task.has_queued_tasks(db, exclude_users=capped):
+            # 时间轮中取出的任务放回，下一轮再调度（不修改任务表）
+            if held_ids:
+                next_round = datetime.utcnow() + timedelta(seconds=settings.SCHEDULER_INTERVAL)
+                try:
+                    cron_schedule.sync([(task_id, next_round) for task_id in held_ids])
+                except RedisError:
+                    pass
+            return {"dispatched": dispatched, "held": len(held_ids)}
+
+        # 没有其他用户在等待：不再限制
+        size = settings.SCHEDULER_BATCH_SIZE
+        for start in range(0, len(held_ids), size):
+            claimed = crud_task.claim_due_tasks(
+                db, task_ids=held_ids[start:start + size], limit=size
+            )
+            if claimed:
+                dispatched += _dispatch(db, claimed)
+        for claimed in _due_batches(db, set(), []):
+            dispatched += _dispatch(db, claimed)
+        return {"dispatched": dispatched, "held": 0}
+
+    finally:
+        db.close()
+
 @celery_app.task
-def schedule_pending_tasks():
-    """调度待执行的任务"""
+def sync_task_schedule() -> Dict[str, Any]:
+    """根据数据库重建调度时间轮，补上遗漏的任务"""
     db = SessionLocal()
+    synced = 0
     try:
-        # 获取所有待执行的任务
-        pending_tasks = crud_task.get_pending_tasks(db)
-        
-        # 将任务加入队列
-        for task in pending_tasks:
-            execute_scraping_task.delay(task.id)
-            
+        last_id = 0
+        while True:
+            rows = crud_task.get_scheduled(db, after_id=last_id)
+            if not rows:
+                break
+            cron_schedule.sync([(row.id, row.next_run) for row in rows])
+            synced += len(rows)
+            last_id = rows[-1].id
+        return {"synced": synced}
+
     finally:
         db.close()
@@ -1,5 +1,8 @@
 from celery import Celery
+from celery.signals import celeryd_init
+from kombu import Queue
 from app.core.config import get_settings
+from app.models.task import TaskPriority
 
 settings = get_settings()
 
@@ -10,8 +13,28 @@ celery_app = Celery(
     include=['app.tasks.scraper_tasks']
 )
 
+# 按优先级分队列：高优先级任务不会排在低优先级积压之后
+PRIORITY_QUEUES = {
+    TaskPriority.HIGH: "scrape.high",
+    TaskPriority.MEDIUM: "scrape.medium",
+    TaskPriority.LOW: "scrape.low",
+}
+DEFAULT_QUEUE = "celery"  # 定时维护任务
+
 # Celery配置
 celery_app.conf.update(
+    task_queues=[Queue(DEFAULT_QUEUE)] + [Queue(name) for name in PRIORITY_QUEUES.values()],
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes={
+        'app.tasks.scraper_tasks.execute_scraping_task': {'queue': PRIORITY_QUEUES[TaskPriority.MEDIUM]},
+        'app.tasks.scraper_tasks.execute_batch_scraping_task': {'queue': PRIORITY_QUEUES[TaskPriority.MEDIUM]},
+    },
+    # 同时消费多个队列的worker按上面的顺序严格优先取高优先级队列
+    broker_transport_options={'queue_order_strategy': 'priority'},
+    worker_prefetch_multiplier=1,
+    # threads池配合每个进程常驻的事件循环（见 app.tasks.event_loop），
+    # 例如: celery -A app.worker worker -P threads -c 100
+    worker_pool=settings.WORKER_POOL,
     task_serializer='json',
     accept_content=['json'],
     result_serializer='json',
@@ -27,10 +50,36 @@ celery_app.conf.update(
 celery_app.conf.beat_schedule = {
     'check-proxies-every-5-minutes': {
         'task': 'app.tasks.scraper_tasks.check_proxies',
-        'schedule': 300.0,  # 5分钟
+        'schedule': float(settings.PROXY_CHECK_INTERVAL),  # 默认5分钟
+    },
+    'schedule-pending-tasks': {
+        'task': 'app.tasks.scraper_tasks.schedule_pending_tasks',
+        'schedule': float(settings.SCHEDULER_INTERVAL),  # 默认10秒
+    },
+    'sync-task-schedule-every-hour': {
+        'task': 'app.tasks.scraper_tasks.sync_task_schedule',
+        'schedule': 3600.0,  # 1小时
     },
     'update-cookies-every-hour': {
         'task': 'app.tasks.scraper_tasks.update_cookies',
         'schedule': 3600.0,  # 1小时
     },
 }
+
+@celeryd_init.connect
+def configure_queue_worker(conf=None, options=None, **kwargs):
+    """只消费一个优先级队列的worker使用该队列的并发数和预取数（命令行 -c 优先）
+
+    例如: celery -A app.worker worker -Q scrape.high
+    """
+    queues = (options or {}).get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    levels = {name: priority.name.lower() for priority, name in PRIORITY_QUEUES.items()}
+    if len(queues) != 1 or queues[0] not in levels:
+        return
+    level = levels[queues[0]]
+    if not options.get("concurrency") and level in settings.QUEUE_CONCURRENCY:
+        conf.worker_concurrency = settings.QUEUE_CONCURRENCY[level]
+    if level in settings.QUEUE_PREFETCH:
+        conf.worker_prefetch_multiplier = settings.QUEUE_PREFETCH[level]
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker
+
+HOST = "example.com"
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_BREAKER_ENABLED", True)
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_FAILURE_WINDOW", 60.0)
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_OPEN_TIME", 0.2)
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_MAX_OPEN_TIME", 10.0)
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_CACHE_TTL", 0.0)
+
+
+def run(test):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis()
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+async def trip(breaker: CircuitBreaker):
+    for _ in range(circuit_breaker.settings.CIRCUIT_FAILURE_THRESHOLD):
+        await breaker.record_failure(HOST)
+
+
+def test_closed_until_threshold():
+    async def test(redis):
+        breaker = CircuitBreaker(redis)
+        assert await breaker.allow(HOST) == 0
+        await breaker.record_failure(HOST)
+        await breaker.record_failure(HOST)
+        assert await breaker.allow(HOST) == 0
+    run(test)
+
+
+def test_success_resets_failure_count():
+    async def test(redis):
+        breaker = CircuitBreaker(redis)
+        await breaker.record_failure(HOST)
+        await breaker.record_failure(HOST)
+        await breaker.record_success(HOST)
+        await breaker.record_failure(HOST)
+        await breaker.record_failure(HOST)
+        assert await breaker.allow(HOST) == 0
+    run(test)
+
+
+def test_success_resets_failures_seen_by_other_workers():
+    async def test(redis):
+        await CircuitBreaker(redis).record_failure(HOST)
+        await CircuitBreaker(redis).record_failure(HOST)
+        # This worker never saw a failure, its success still resets the count
+        await CircuitBreaker(redis).record_success(HOST)
+        await CircuitBreaker(redis).record_failure(HOST)
+        await CircuitBreaker(redis).record_failure(HOST)
+        assert await CircuitBreaker(redis).allow(HOST) == 0
+    run(test)
+
+
+def test_late_success_does_not_close_open_circuit():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        # A request admitted before the trip finishes while the circuit is open
+        await CircuitBreaker(redis).record_success(HOST)
+        await asyncio.sleep(0.25)
+        prober, other = CircuitBreaker(redis), CircuitBreaker(redis)
+        assert await prober.allow(HOST, probe_timeout=5) == 0
+        assert await other.allow(HOST, probe_timeout=5) > 0
+    run(test)
+
+
+def test_opens_after_threshold_and_is_shared():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        # Another worker sees the circuit open through Redis
+        wait = await CircuitBreaker(redis).allow(HOST)
+        assert 0 < wait <= 0.2
+        assert await CircuitBreaker(redis).allow("other.example.com") == 0
+    run(test)
+
+
+def test_half_open_admits_a_single_probe():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        await asyncio.sleep(0.25)
+        prober, other = CircuitBreaker(redis), CircuitBreaker(redis)
+        assert await prober.allow(HOST, probe_timeout=5) == 0
+        assert await other.allow(HOST, probe_timeout=5) > 0
+    run(test)
+
+
+def test_probe_success_closes():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        await asyncio.sleep(0.25)
+        prober = CircuitBreaker(redis)
+        assert await prober.allow(HOST) == 0
+        await prober.record_success(HOST)
+        assert await CircuitBreaker(redis).allow(HOST) == 0
+        assert await CircuitBreaker(redis).allow(HOST) == 0
+    run(test)
+
+
+def test_probe_failure_reopens_for_longer():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        await asyncio.sleep(0.25)
+        prober = CircuitBreaker(redis)
+        assert await prober.allow(HOST) == 0
+        await prober.record_failure(HOST)
+        wait = await CircuitBreaker(redis).allow(HOST)
+        assert 0.2 < wait <= 0.4
+    run(test)
+
+
+def test_abandoned_probe_is_replaced():
+    async def test(redis):
+        await trip(CircuitBreaker(redis))
+        await asyncio.sleep(0.25)
+        assert await CircuitBreaker(redis).allow(HOST, probe_timeout=0.1) == 0
+        await asyncio.sleep(0.15)
+        assert await CircuitBreaker(redis).allow(HOST, probe_timeout=0.1) == 0
+    run(test)
+
+
+def test_disabled_breaker_always_allows(monkeypatch):
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_BREAKER_ENABLED", False)
+
+    async def test(redis):
+        breaker = CircuitBreaker(redis)
+        await trip(breaker)
+        assert await breaker.allow(HOST) == 0
+    run(test)
+
+
+def test_local_cache_keeps_recent_hosts(monkeypatch):
+    monkeypatch.setattr(circuit_breaker.settings, "CIRCUIT_MAX_HOSTS", 2)
+
+    async def test(redis):
+        breaker = CircuitBreaker(redis)
+        await trip(breaker)
+        for i in range(3):
+            await breaker.allow(f"{i}.example.com")
+        assert list(breaker._hosts) == ["1.example.com", "2.example.com"]
+        # The evicted host is still open through Redis
+        assert await breaker.allow(HOST) > 0
+    run(test)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services.cookie_manager import CookieManager
+
+DOMAIN = "example.com"
+KEY = f"cookies:{DOMAIN}"
+EXPIRY_KEY = f"cookie_expiry:{DOMAIN}"
+
+
+def run(test):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+async def save_legacy(redis, cookies, expires_in=None):
+    """Write cookies the way the string-based version did"""
+    await redis.set(KEY, json.dumps(cookies))
+    if expires_in is not None:
+        await redis.set(EXPIRY_KEY, (datetime.utcnow() + expires_in).timestamp())
+
+
+def test_save_and_get():
+    async def test(redis):
+        manager = CookieManager(redis)
+        await manager.save_cookies(DOMAIN, {"sid": "1"}, expiry=timedelta(hours=1))
+        assert await manager.get_cookies(DOMAIN) == {"sid": "1"}
+        assert await redis.type(KEY) == "hash"
+        assert 3500 < await redis.ttl(KEY) <= 3600
+    run(test)
+
+
+def test_save_replaces_previous_cookies():
+    async def test(redis):
+        manager = CookieManager(redis)
+        await manager.save_cookies(DOMAIN, {"sid": "1", "old": "x"})
+        await manager.save_cookies(DOMAIN, {"sid": "2"})
+        assert await CookieManager(redis).get_cookies(DOMAIN) == {"sid": "2"}
+    run(test)
+
+
+def test_legacy_cookies_are_migrated_with_their_expiry():
+    async def test(redis):
+        await save_legacy(redis, {"sid": "1"}, expires_in=timedelta(seconds=100))
+        manager = CookieManager(redis)
+        assert await manager.get_cookies(DOMAIN) == {"sid": "1"}
+        assert await redis.type(KEY) == "hash"
+        assert 95 <= await redis.ttl(KEY) <= 100
+        assert not await redis.exists(EXPIRY_KEY)
+        assert await CookieManager(redis).get_cookies(DOMAIN) == {"sid": "1"}
+    run(test)
+
+
+def test_legacy_cookies_without_expiry_are_kept():
+    async def test(redis):
+        await save_legacy(redis, {"sid": "1"})
+        assert await CookieManager(redis).get_cookies(DOMAIN) == {"sid": "1"}
+        assert await redis.ttl(KEY) == -1
+    run(test)
+
+
+def test_expired_legacy_cookies_are_deleted():
+    async def test(redis):
+        await save_legacy(redis, {"sid": "1"}, expires_in=timedelta(seconds=-100))
+        manager = CookieManager(redis)
+        assert await manager.get_cookies(DOMAIN) is None
+        assert await manager.is_expired(DOMAIN)
+        assert not await redis.exists(KEY, EXPIRY_KEY)
+    run(test)
+
+
+def test_delete_and_list_domains():
+    async def test(redis):
+        manager = CookieManager(redis)
+        await manager.save_cookies(DOMAIN, {"sid": "1"})
+        await manager.save_cookies("other.com", {"sid": "3"})
+        assert sorted(await manager.get_all_domains()) == ["example.com", "other.com"]
+        await manager.delete_cookies(DOMAIN)
+        assert await manager.get_cookies(DOMAIN) is None
+    run(test)
@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.cron import CronExpression, compile_cron, next_run_for
+
+
+def fire(expression: str, after: datetime) -> datetime:
+    return CronExpression(expression).next_fire(after)
+
+
+def test_next_fire_is_strictly_after():
+    assert fire("30 10 * * *", datetime(2026, 10, 1, 10, 30)) == datetime(2026, 10, 2, 10, 30)
+    assert fire("30 10 * * *", datetime(2026, 10, 1, 10, 29, 59)) == datetime(2026, 10, 1, 10, 30)
+
+
+def test_day_of_month_or_day_of_week():
+    # The 13th or any Friday; 2026-10-01 is a Thursday
+    assert fire("0 0 13 * 5", datetime(2026, 10, 1)) == datetime(2026, 10, 2)
+    assert fire("0 0 13 * 5", datetime(2026, 10, 10)) == datetime(2026, 10, 13)
+
+
+def test_day_of_month_only():
+    assert fire("0 0 13 * *", datetime(2026, 10, 1)) == datetime(2026, 10, 13)
+
+
+def test_day_of_week_only_and_sunday_as_seven():
+    assert fire("0 9 * * 7", datetime(2026, 10, 1)) == datetime(2026, 10, 4, 9, 0)
+    assert fire("0 9 * * sun", datetime(2026, 10, 1)) == datetime(2026, 10, 4, 9, 0)
+
+
+def test_steps():
+    assert fire("*/15 * * * *", datetime(2026, 10, 1, 10, 7)) == datetime(2026, 10, 1, 10, 15)
+    assert fire("*/15 * * * *", datetime(2026, 10, 1, 10, 45)) == datetime(2026, 10, 1, 11, 0)
+    assert fire("5/20 * * * *", datetime(2026, 10, 1, 10, 26)) == datetime(2026, 10, 1, 10, 45)
+    assert fire("0 8-18/4 * * *", datetime(2026, 10, 1, 12, 0)) == datetime(2026, 10, 1, 16, 0)
+
+
+def test_month_rollover():
+    assert fire("0 0 1 jan *", datetime(2026, 10, 1)) == datetime(2027, 1, 1)
+    assert fire("0 0 31 * *", datetime(2026, 11, 1)) == datetime(2026, 12, 31)
+
+
+@pytest.mark.parametrize("macro, expected", [
+    ("@hourly", datetime(2026, 10, 1, 11, 0)),
+    ("@daily", datetime(2026, 10, 2)),
+    ("@midnight", datetime(2026, 10, 2)),
+    ("@weekly", datetime(2026, 10, 4)),
+    ("@monthly", datetime(2026, 11, 1)),
+    ("@yearly", datetime(2027, 1, 1)),
+])
+def test_macros(macro, expected):
+    assert fire(macro, datetime(2026, 10, 1, 10, 30)) == expected
+
+
+def test_leap_day():
+    assert fire("0 0 29 2 *", datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+
+
+def test_never_firing_expression():
+    with pytest.raises(ValueError):
+        fire("0 0 30 2 *", datetime(2026, 10, 1))
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *", "60 * * * *", "* 24 * * *", "0 0 0 * *", "*/0 * * * *", "0 0 * * funday",
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+def test_aware_datetimes_are_converted_to_utc():
+    after = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc).astimezone()
+    assert fire("0 13 * * *", after) == datetime(2026, 10, 1, 13, 0)
+
+
+def test_next_run_for():
+    assert next_run_for(None) is None
+    assert next_run_for("") is None
+    assert next_run_for("@daily", datetime(2026, 10, 1, 10, 30)) == datetime(2026, 10, 2)
+    assert compile_cron("@daily") is compile_cron("@daily")
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services import deduplicator as deduplicator_module
+from app.services.deduplicator import Deduplicator, fingerprint, hamming_distance, simhash
+
+DATA = {"title": ["Cheap flights to Lisbon"], "price": ["120 EUR"]}
+
+
+def run(test):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+def test_fingerprint_is_stable_and_order_independent():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint("page") == fingerprint(b"page")
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_simhash_of_similar_texts_is_close():
+    a = simhash("the quick brown fox jumps over the lazy dog " * 5)
+    b = simhash("the quick brown fox jumps over the lazy cat " * 5)
+    c = simhash("completely different content about something else entirely")
+    assert hamming_distance(a, b) < hamming_distance(a, c)
+
+
+def test_first_result_is_not_a_duplicate():
+    async def test(redis):
+        duplicate, fingerprints = await Deduplicator(redis).check("1", DATA)
+        assert not duplicate
+        assert fingerprints["data"] == fingerprint(DATA)
+    run(test)
+
+
+def test_check_is_read_only():
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        await dedup.check("1", DATA)
+        # The result was never committed (e.g. storing it failed)
+        duplicate, _ = await dedup.check("1", DATA)
+        assert not duplicate
+        assert not await redis.exists("dedup:1")
+    run(test)
+
+
+def test_committed_result_is_a_duplicate():
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        _, fingerprints = await dedup.check("1", DATA)
+        await dedup.commit("1", fingerprints)
+        duplicate, _ = await dedup.check("1", DATA)
+        assert duplicate
+        duplicate, _ = await dedup.check("1", {**DATA, "price": ["99 EUR"]})
+        assert not duplicate
+        duplicate, _ = await dedup.check("2", DATA)
+        assert not duplicate
+    run(test)
+
+
+def test_matching_content_hash_is_a_duplicate():
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        _, fingerprints = await dedup.check("1", DATA, content_hash="abc")
+        await dedup.commit("1", fingerprints)
+        duplicate, _ = await dedup.check("1", {"other": []}, content_hash="abc")
+        assert duplicate
+    run(test)
+
+
+def test_near_duplicates_within_distance():
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        text = {"body": ["the quick brown fox jumps over the lazy dog " * 20]}
+        near = {"body": ["the quick brown fox jumps over the lazy dog " * 20 + "today"]}
+        _, fingerprints = await dedup.check("1", text, max_distance=8)
+        await dedup.commit("1", fingerprints)
+        duplicate, _ = await dedup.check("1", near, max_distance=8)
+        assert duplicate
+        duplicate, _ = await dedup.check("1", near)
+        assert not duplicate
+    run(test)
+
+
+def test_committing_a_duplicate_keeps_the_fingerprint_and_refreshes_ttl(monkeypatch):
+    monkeypatch.setattr(deduplicator_module.settings, "DEDUP_TTL", 100)
+
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        _, fingerprints = await dedup.check("1", DATA)
+        await dedup.commit("1", fingerprints)
+        await redis.expire("dedup:1", 10)
+        await dedup.commit("1", None)
+        assert await redis.hget("dedup:1", "data") == fingerprint(DATA)
+        assert 90 < await redis.ttl("dedup:1") <= 100
+    run(test)
+
+
+def test_forget_drops_nested_keys():
+    async def test(redis):
+        dedup = Deduplicator(redis)
+        for key in ("1", "1:https://a.example", "1:https://b.example", "10"):
+            _, fingerprints = await dedup.check(key, DATA)
+            await dedup.commit(key, fingerprints)
+        await dedup.forget("1")
+        assert sorted(await redis.keys("dedup:*")) == ["dedup:10"]
+    run(test)
@@ -0,0 +1,83 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.task import TaskPriority
+from app.tasks import dispatch
+from app.tasks.dispatch import DispatchError, dispatch_tasks
+
+
+def row(task_id: int, user_id: int = 1, priority: TaskPriority = TaskPriority.MEDIUM,
+        config=None) -> SimpleNamespace:
+    return SimpleNamespace(id=task_id, user_id=user_id, priority=priority, config=config)
+
+
+class FakeSignature:
+    def __init__(self, task_id: int, sent: list, fail_on: set):
+        self.task_id = task_id
+        self.sent = sent
+        self.fail_on = fail_on
+
+    def apply_async(self, producer=None):
+        if self.task_id in self.fail_on:
+            raise ConnectionError("broker unavailable")
+        self.sent.append(self.task_id)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    state = SimpleNamespace(sent=[], fail_on=set())
+    monkeypatch.setattr(dispatch.celery_app, "producer_or_acquire", lambda: nullcontext())
+    monkeypatch.setattr(
+        dispatch, "task_signature",
+        lambda task_id, config=None, priority=None: FakeSignature(task_id, state.sent, state.fail_on)
+    )
+    return state
+
+
+def test_dispatch_sends_every_task(broker):
+    assert dispatch_tasks([row(1), row(2), row(3)]) == 3
+    assert sorted(broker.sent) == [1, 2, 3]
+
+
+def test_dispatch_failure_reports_sent_ids(broker):
+    broker.fail_on = {3}
+    with pytest.raises(DispatchError) as exc_info:
+        dispatch_tasks([row(1), row(2), row(3), row(4)])
+    assert exc_info.value.sent_ids == broker.sent == [1, 2]
+
+
+def test_task_signature_routes_by_config_and_priority():
+    single = dispatch.task_signature(1, {}, TaskPriority.HIGH)
+    batch = dispatch.task_signature(2, {"urls": ["https://example.com"]}, None)
+    assert single.task == dispatch.EXECUTE_TASK
+    assert single.options["queue"] == "scrape.high"
+    assert batch.task == dispatch.EXECUTE_BATCH_TASK
+    assert batch.options["queue"] == "scrape.medium"
+
+
+def test_fair_order_puts_higher_priority_first():
+    rows = [row(1, priority=TaskPriority.LOW), row(2, priority=TaskPriority.HIGH),
+            row(3, priority=TaskPriority.MEDIUM)]
+    assert [r.id for r in dispatch.fair_order(rows)] == [2, 3, 1]
+
+
+def test_fair_order_round_robins_users_within_a_priority():
+    rows = [row(1, user_id=1), row(2, user_id=1), row(3, user_id=1),
+            row(4, user_id=2), row(5, user_id=3), row(6, user_id=2)]
+    assert [r.id for r in dispatch.fair_order(rows)] == [1, 4, 5, 2, 6, 3]
+
+
+def test_fair_order_keeps_each_users_order():
+    rows = [row(i, user_id=i % 2, priority=TaskPriority.HIGH if i < 4 else TaskPriority.LOW)
+            for i in range(8)]
+    ordered = [r.id for r in dispatch.fair_order(rows)]
+    assert sorted(ordered) == list(range(8))
+    for user_id in (0, 1):
+        mine = [i for i in ordered if i % 2 == user_id]
+        assert mine == sorted(mine)
+
+
+def test_fair_order_of_nothing():
+    assert dispatch.fair_order([]) == []
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.tasks.event_loop import LoopRunner
+
+
+@pytest.fixture
+def runner():
+    runner = LoopRunner(max_in_flight=1)
+    yield runner
+    runner.stop()
+
+
+async def sleep_and_return(seconds: float, value):
+    await asyncio.sleep(seconds)
+    return value
+
+
+def test_run_returns_the_result(runner):
+    assert runner.run(sleep_and_return(0, 42)) == 42
+
+
+def test_run_propagates_exceptions(runner):
+    async def fail():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        runner.run(fail())
+
+
+def test_run_times_out_a_slow_coroutine(runner):
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        runner.run(sleep_and_return(5, None), timeout=0.1)
+    assert time.monotonic() - started < 1
+    # The slot is released for the next coroutine
+    assert runner.run(sleep_and_return(0, "next"), timeout=0.1) == "next"
+
+
+def test_waiting_for_a_slot_does_not_count_against_the_timeout(runner):
+    holder = threading.Thread(target=runner.run, args=(sleep_and_return(0.3, None),))
+    holder.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    assert runner.run(sleep_and_return(0.05, "done"), timeout=0.1) == "done"
+    assert time.monotonic() - started >= 0.25
+    holder.join()
+
+
+def test_runs_from_many_threads_share_the_loop():
+    runner = LoopRunner(max_in_flight=10)
+    try:
+        results = []
+        threads = [
+            threading.Thread(target=lambda i=i: results.append(runner.run(sleep_and_return(0.1, i))))
+            for i in range(5)
+        ]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(results) == list(range(5))
+        assert time.monotonic() - started < 0.4
+    finally:
+        runner.stop()
@@ -0,0 +1,56 @@
+from bs4 import BeautifulSoup
+
+from app.services.extractor import get_extraction_plan, parse_and_extract
+
+PAGE = """
+<html><body>
+  <h1 class="title">Products</h1>
+  <ul id="products">
+    <li class="item"><span class="name">Apple</span> <span class="price">1.20</span></li>
+    <li class="item sale"><span class="name">Pear</span> <span class="price">0.80</span>
+      <ul><li class="item"><span class="name">Nested</span></li></ul></li>
+    <li class="item"><span class="name">Plum</span></li>
+  </ul>
+  <a href="/next" class="next">Next</a>
+</body></html>
+"""
+
+FLAT = {
+    "title": "h1.title",
+    "names": "li.item > .name",
+    "prices": "#products .price",
+    "sale": "li.sale .name",
+    "links": "a[href]",
+    "missing": "table td",
+}
+
+
+def texts(soup, selector):
+    return [el.get_text(strip=True) for el in soup.select(selector)]
+
+
+def test_flat_fields_match_soup_select():
+    soup = BeautifulSoup(PAGE, "html.parser")
+    result = get_extraction_plan(FLAT).extract(soup)
+    assert result == {key: texts(soup, selector) for key, selector in FLAT.items()}
+
+
+def test_scoped_groups_match_soup_select_per_scope():
+    selectors = {"items": {"scope": "li.item",
+                           "fields": {"name": ".name", "price": ".price"}}}
+    soup = BeautifulSoup(PAGE, "html.parser")
+    result = get_extraction_plan(selectors).extract(soup)
+    assert result["items"] == [
+        {"name": texts(el, ".name"), "price": texts(el, ".price")}
+        for el in soup.select("li.item")
+    ]
+
+
+def test_parse_and_extract_with_lxml():
+    soup = BeautifulSoup(PAGE, "lxml")
+    result = parse_and_extract(PAGE, FLAT, "lxml")
+    assert result == {key: texts(soup, selector) for key, selector in FLAT.items()}
+
+
+def test_plans_are_cached_by_content():
+    assert get_extraction_plan({"a": "h1", "b": "p"}) is get_extraction_plan({"b": "p", "a": "h1"})
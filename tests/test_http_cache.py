@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services import http_cache, scraper as scraper_module
+from app.services.http_cache import HTTPCache
+from app.services.scraper import Scraper
+
+URL = "https://example.com/page"
+PAGE = "<html><body><h1>Title</h1></body></html>"
+
+
+def run(test):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+def test_build_entry_reads_validators_case_insensitively():
+    entry = HTTPCache.build_entry({"etag": '"v1"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    assert entry == {"etag": '"v1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+                     "content": None}
+    assert HTTPCache(None).get_validators(entry) == {
+        "If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"
+    }
+
+
+def test_build_entry_without_validators():
+    assert HTTPCache.build_entry({"Content-Type": "text/html"}, PAGE) is None
+
+
+def test_build_entry_drops_large_bodies(monkeypatch):
+    monkeypatch.setattr(http_cache.settings, "HTTP_CACHE_MAX_BODY_BYTES", 10)
+    assert HTTPCache.build_entry({"ETag": '"v1"'}, PAGE)["content"] is None
+    assert HTTPCache.build_entry({"ETag": '"v1"'}, "short")["content"] == "short"
+
+
+def test_entries_are_separated_by_variant():
+    async def test(redis):
+        cache = HTTPCache(redis)
+        await cache.save(URL, HTTPCache.build_entry({"ETag": '"v1"'}), variant="1:abc")
+        assert (await cache.get(URL, "1:abc"))["etag"] == '"v1"'
+        assert await cache.get(URL, "2:abc") is None
+        assert await cache.get(URL) is None
+    run(test)
+
+
+def test_eviction_keeps_the_cache_under_its_limit(monkeypatch):
+    monkeypatch.setattr(http_cache.settings, "HTTP_CACHE_MAX_BYTES", 1000)
+
+    async def test(redis):
+        cache = HTTPCache(redis)
+        for i in range(20):
+            await cache.save(f"{URL}/{i}", HTTPCache.build_entry({"ETag": f'"{i}"'}, "x" * 100))
+        assert int(await redis.get(cache.size_key)) <= 1000
+        # The oldest entries go first
+        assert await cache.get(f"{URL}/0") is None
+        assert await cache.get(f"{URL}/19") is not None
+    run(test)
+
+
+class FakeFetch:
+    """Stands in for Scraper.fetch, replying 304 when the validators match"""
+
+    def __init__(self, etag: str = '"v1"'):
+        self.etag = etag
+        self.sent_headers = []
+
+    async def __call__(self, url, headers=None, **kwargs):
+        headers = headers or {}
+        self.sent_headers.append(headers)
+        if headers.get("If-None-Match") == self.etag:
+            return {"success": True, "status": 304, "not_modified": True,
+                    "content": None, "headers": {}, "url": url}
+        return {"success": True, "status": 200, "content": PAGE, "body": None,
+                "content_type": "text/html", "stopped_early": False,
+                "headers": {"ETag": self.etag}, "url": url}
+
+
+@pytest.fixture
+def make_scraper(monkeypatch):
+    monkeypatch.setattr(scraper_module.settings, "PARSER_EXECUTOR", "none")
+    monkeypatch.setattr(scraper_module.settings, "HTTP_CACHE_ENABLED", True)
+
+    def make(redis) -> Scraper:
+        scraper = Scraper()
+        scraper.http_cache = HTTPCache(redis)
+        scraper.fetch = FakeFetch()
+        return scraper
+    return make
+
+
+CONFIG = {"selectors": {"title": "h1"}, "parser": "html.parser"}
+
+
+def test_validators_are_saved_only_when_the_caller_commits(make_scraper):
+    async def test(redis):
+        scraper = make_scraper(redis)
+        result = await scraper.scrape(URL, CONFIG, cache_scope="1")
+        assert result["data"] == {"title": ["Title"]}
+        # Not stored by the caller yet, so the next run fetches in full
+        result = await scraper.scrape(URL, CONFIG, cache_scope="1")
+        assert "If-None-Match" not in scraper.fetch.sent_headers[-1]
+        await scraper.save_http_cache([result])
+        result = await scraper.scrape(URL, CONFIG, cache_scope="1")
+        assert scraper.fetch.sent_headers[-1]["If-None-Match"] == '"v1"'
+        assert result["not_modified"] and result["data"] is None
+    run(test)
+
+
+def test_validators_are_scoped_to_the_caller(make_scraper):
+    async def test(redis):
+        scraper = make_scraper(redis)
+        await scraper.save_http_cache([await scraper.scrape(URL, CONFIG, cache_scope="1")])
+        result = await scraper.scrape(URL, CONFIG, cache_scope="2")
+        assert "If-None-Match" not in scraper.fetch.sent_headers[-1]
+        assert result["data"] == {"title": ["Title"]}
+    run(test)
+
+
+def test_changed_extraction_config_refetches(make_scraper):
+    async def test(redis):
+        scraper = make_scraper(redis)
+        await scraper.save_http_cache([await scraper.scrape(URL, CONFIG, cache_scope="1")])
+        config = {**CONFIG, "selectors": {"heading": "h1"}}
+        result = await scraper.scrape(URL, config, cache_scope="1")
+        assert result["data"] == {"heading": ["Title"]}
+    run(test)
+
+
+def test_not_modified_reuses_cached_body(make_scraper):
+    async def test(redis):
+        scraper = make_scraper(redis)
+        config = {**CONFIG, "cache_body": True}
+        await scraper.save_http_cache([await scraper.scrape(URL, config, cache_scope="1")])
+        result = await scraper.scrape(URL, config, cache_scope="1", reuse_cached_body=True)
+        assert scraper.fetch.sent_headers[-1]["If-None-Match"] == '"v1"'
+        assert result["data"] == {"title": ["Title"]}
+    run(test)
+
+
+def test_no_validators_without_a_cached_body_to_fall_back_on(make_scraper):
+    async def test(redis):
+        scraper = make_scraper(redis)
+        await scraper.save_http_cache([await scraper.scrape(URL, CONFIG, cache_scope="1")])
+        result = await scraper.scrape(URL, CONFIG, cache_scope="1", reuse_cached_body=True)
+        assert "If-None-Match" not in scraper.fetch.sent_headers[-1]
+        assert result["data"] == {"title": ["Title"]}
+    run(test)
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.models.proxy import Proxy
+from app.services import proxy_manager
+from app.services.proxy_manager import ProxyManager
+
+
+@pytest.fixture(autouse=True)
+def proxy_settings(monkeypatch):
+    monkeypatch.setattr(proxy_manager.settings, "PROXY_COOLDOWN", 60.0)
+    monkeypatch.setattr(proxy_manager.settings, "PROXY_MAX_COOLDOWN", 600.0)
+
+
+def make_proxy(port: int, successes: int = 0, failures: int = 0,
+               latency: float = 0.0) -> Proxy:
+    return Proxy(id=port, host="10.0.0.1", port=port, protocol="http", is_active=True,
+                 success_count=successes, failure_count=failures,
+                 average_response_time=latency)
+
+
+def url(port: int) -> str:
+    return f"http://10.0.0.1:{port}"
+
+
+def manager_with(*proxies: Proxy) -> ProxyManager:
+    manager = ProxyManager()
+    # Skip the database reload in get_proxy
+    manager._last_update = datetime.utcnow()
+    for proxy in proxies:
+        manager._track(proxy)
+    return manager
+
+
+def run(test):
+    asyncio.run(test())
+
+
+def test_picks_the_best_scoring_proxy():
+    async def test():
+        manager = manager_with(
+            make_proxy(1, successes=5, failures=5),
+            make_proxy(2, successes=9, failures=1),
+            make_proxy(3, successes=9, failures=1, latency=2.0),
+        )
+        assert await manager.get_proxy() == url(2)
+    run(test)
+
+
+def test_in_flight_requests_spread_load():
+    async def test():
+        manager = manager_with(make_proxy(1), make_proxy(2))
+        picked = {await manager.get_proxy(), await manager.get_proxy()}
+        assert picked == {url(1), url(2)}
+    run(test)
+
+
+def test_empty_pool_returns_none():
+    async def test():
+        assert await manager_with().get_proxy() is None
+    run(test)
+
+
+def test_failed_proxy_cools_down():
+    async def test():
+        manager = manager_with(make_proxy(1), make_proxy(2, failures=3))
+        first = await manager.get_proxy()
+        assert first == url(1)
+        manager.report_result(first, False)
+        for _ in range(3):
+            assert await manager.get_proxy() == url(2)
+    run(test)
+
+
+def test_concurrent_success_does_not_end_cooldown():
+    async def test():
+        manager = manager_with(make_proxy(1), make_proxy(2, failures=3))
+        # Two requests go through proxy 1; the first fails, the second succeeds
+        manager._proxies[url(1)].in_flight = 2
+        manager.report_result(url(1), False)
+        manager.report_result(url(1), True, 0.1)
+        for _ in range(3):
+            assert await manager.get_proxy() == url(2)
+    run(test)
+
+
+def test_cooled_down_proxy_returns():
+    async def test():
+        manager = manager_with(make_proxy(1), make_proxy(2, failures=3))
+        manager.report_result(url(1), False)
+        # Expire the cooldown
+        manager._proxies[url(1)].cooldown_until = 0.0
+        manager._cooldown = [(0.0, url(1))]
+        assert await manager.get_proxy() == url(1)
+    run(test)
+
+
+def test_affinity_prefers_last_good_proxy_for_domain():
+    async def test():
+        manager = manager_with(make_proxy(1, successes=9), make_proxy(2))
+        manager.report_result(url(2), True, 0.1, domain="example.com")
+        assert await manager.get_proxy("example.com") == url(2)
+        assert await manager.get_proxy("other.com") == url(1)
+    run(test)
+
+
+def test_affinity_is_dropped_on_failure():
+    async def test():
+        manager = manager_with(make_proxy(1, successes=9), make_proxy(2))
+        manager.report_result(url(2), True, 0.1, domain="example.com")
+        manager.report_result(url(2), False, domain="example.com")
+        assert await manager.get_proxy("example.com") == url(1)
+    run(test)
+
+
+def test_release_keeps_score():
+    async def test():
+        manager = manager_with(make_proxy(1))
+        proxy = await manager.get_proxy()
+        state = manager._proxies[proxy]
+        manager.release(proxy)
+        assert state.in_flight == 0
+        assert (state.successes, state.failures) == (0, 0)
+        assert await manager.get_proxy() == proxy
+    run(test)
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from app.services import rate_limiter
+from app.services.rate_limiter import TOKEN_BUCKET_SCRIPT, RateLimiter, parse_retry_after
+
+DOMAIN = "example.com"
+
+
+@pytest.fixture(autouse=True)
+def limiter_settings(monkeypatch):
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limiter.settings, "DOMAIN_RATE_LIMIT", 10.0)
+    monkeypatch.setattr(rate_limiter.settings, "DOMAIN_BURST", 3)
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_LEASE_SIZE", 2)
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_BACKOFF", 0.2)
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_MAX_BACKOFF", 1.0)
+
+
+def run(test):
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis()
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+def test_bucket_grants_burst_then_asks_to_wait():
+    async def test(redis):
+        script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        keys = ["bucket", "block"]
+        granted = [await script(keys=keys, args=[10, 3, 2]) for _ in range(3)]
+        assert [int(g) for g, _ in granted] == [2, 1, 0]
+        wait_ms = int(granted[2][1])
+        assert 0 < wait_ms <= 100
+    run(test)
+
+
+def test_bucket_refills_at_rate():
+    async def test(redis):
+        script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        keys = ["bucket", "block"]
+        await script(keys=keys, args=[10, 2, 2])
+        await asyncio.sleep(0.15)
+        granted, _ = await script(keys=keys, args=[10, 2, 2])
+        assert int(granted) == 1
+    run(test)
+
+
+def test_blocked_domain_grants_nothing():
+    async def test(redis):
+        script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        await redis.set("block", 1, px=500)
+        granted, wait_ms = await script(keys=["bucket", "block"], args=[10, 3, 2])
+        assert int(granted) == 0
+        assert 0 < int(wait_ms) <= 500
+    run(test)
+
+
+def test_limiter_admits_burst_then_paces():
+    async def test(redis):
+        limiter = RateLimiter(redis)
+        started = time.monotonic()
+        for _ in range(3):
+            async with limiter.limit(DOMAIN):
+                pass
+        assert time.monotonic() - started < 0.05
+        async with limiter.limit(DOMAIN):
+            pass
+        assert time.monotonic() - started >= 0.05
+    run(test)
+
+
+def test_limiter_is_shared_between_workers():
+    async def test(redis):
+        first, second = RateLimiter(redis), RateLimiter(redis)
+        for _ in range(3):
+            await first.acquire(DOMAIN)
+        started = time.monotonic()
+        await second.acquire(DOMAIN)
+        assert time.monotonic() - started >= 0.05
+    run(test)
+
+
+def test_backoff_blocks_and_slows_domain():
+    async def test(redis):
+        limiter = RateLimiter(redis)
+        await limiter.backoff(DOMAIN)
+        state = limiter._state(DOMAIN)
+        assert state.rate_factor == 0.5
+        assert 0 < await redis.pttl(f"rate_limit_block:{DOMAIN}") <= 200
+        # Another worker is blocked through Redis too
+        started = time.monotonic()
+        await RateLimiter(redis).acquire(DOMAIN)
+        assert time.monotonic() - started >= 0.1
+    run(test)
+
+
+def test_backoff_honors_retry_after_and_recovers():
+    async def test(redis):
+        limiter = RateLimiter(redis)
+        await limiter.backoff(DOMAIN, "0.5")
+        assert 200 < await redis.pttl(f"rate_limit_block:{DOMAIN}") <= 500
+        state = limiter._state(DOMAIN)
+        limiter.record_success(DOMAIN)
+        assert state.backoffs == 0
+        assert state.rate_factor == pytest.approx(0.55)
+    run(test)
+
+
+def test_idle_domains_are_evicted_past_the_cap(monkeypatch):
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_MAX_DOMAINS", 2)
+
+    async def test(redis):
+        limiter = RateLimiter(redis)
+        async with limiter.limit("busy.example.com"):
+            for i in range(5):
+                async with limiter.limit(f"{i}.example.com"):
+                    pass
+            # The domain in use keeps its state and its concurrency cap
+            assert list(limiter._domains) == ["busy.example.com", "4.example.com"]
+        limiter._state("a.example.com")
+        limiter._state("b.example.com")
+        assert list(limiter._domains) == ["a.example.com", "b.example.com"]
+    run(test)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("-5") == 0.0
+    assert parse_retry_after("soon") is None
+    later = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 55 <= parse_retry_after(format_datetime(later, usegmt=True)) <= 60
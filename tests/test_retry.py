@@ -0,0 +1,89 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from app.services.retry import (
+    ErrorKind, backoff_delay, classify_exception, classify_status, is_retryable
+)
+
+CONNECTION_KEY = SimpleNamespace(host="example.com", port=443, ssl=True)
+
+
+def connector_error(cls, os_error):
+    return cls(CONNECTION_KEY, os_error)
+
+
+@pytest.mark.parametrize("status, kind", [
+    (400, ErrorKind.CLIENT),
+    (403, ErrorKind.CLIENT),
+    (404, ErrorKind.CLIENT),
+    (407, ErrorKind.PROXY),
+    (408, ErrorKind.TIMEOUT),
+    (429, ErrorKind.RATE_LIMITED),
+    (500, ErrorKind.SERVER),
+    (501, ErrorKind.CLIENT),
+    (502, ErrorKind.SERVER),
+    (503, ErrorKind.SERVER),
+    (505, ErrorKind.CLIENT),
+])
+def test_classify_status(status, kind):
+    assert classify_status(status) == kind
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (asyncio.TimeoutError(), ErrorKind.TIMEOUT),
+    (connector_error(aiohttp.ClientProxyConnectionError, OSError("refused")), ErrorKind.PROXY),
+    (connector_error(aiohttp.ClientConnectorError,
+                     socket.gaierror(socket.EAI_NONAME, "unknown host")), ErrorKind.DNS),
+    (connector_error(aiohttp.ClientConnectorError,
+                     socket.gaierror(socket.EAI_AGAIN, "try again")), ErrorKind.CONNECTION),
+    (connector_error(aiohttp.ClientConnectorError, ConnectionRefusedError()), ErrorKind.CONNECTION),
+    (aiohttp.ServerDisconnectedError(), ErrorKind.CONNECTION),
+    (aiohttp.ClientPayloadError("truncated"), ErrorKind.CONNECTION),
+    (aiohttp.InvalidURL("not a url"), ErrorKind.CLIENT),
+    (ValueError("bug"), ErrorKind.OTHER),
+])
+def test_classify_exception(exc, kind):
+    assert classify_exception(exc) == kind
+
+
+@pytest.mark.parametrize("kind, retryable", [
+    (ErrorKind.TIMEOUT, True),
+    (ErrorKind.CONNECTION, True),
+    (ErrorKind.PROXY, True),
+    (ErrorKind.RATE_LIMITED, True),
+    (ErrorKind.SERVER, True),
+    (ErrorKind.CIRCUIT_OPEN, True),
+    (ErrorKind.DNS, False),
+    (ErrorKind.CLIENT, False),
+    (ErrorKind.TOO_LARGE, False),
+    (ErrorKind.DEADLINE, False),
+    (ErrorKind.OTHER, False),
+    (None, False),
+])
+def test_is_retryable(kind, retryable):
+    assert is_retryable(kind) is retryable
+    if kind is not None:
+        # Kinds come back as plain strings from task results
+        assert is_retryable(kind.value) is retryable
+
+
+@pytest.mark.parametrize("attempt", range(6))
+def test_backoff_delay_is_jittered_between_half_and_full(attempt):
+    full = min(30.0, 1.0 * 2 ** attempt)
+    delays = [backoff_delay(attempt, 1.0, 30.0) for _ in range(200)]
+    assert all(full / 2 <= d <= full for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_delay_is_capped():
+    assert all(15.0 <= backoff_delay(20, 1.0, 30.0) <= 30.0 for _ in range(50))
+
+
+def test_backoff_delay_honors_retry_after_up_to_the_cap():
+    assert backoff_delay(0, 1.0, 30.0, retry_after=10.0) == 10.0
+    assert backoff_delay(0, 1.0, 30.0, retry_after=120.0) == 30.0
+    assert 4.0 <= backoff_delay(3, 1.0, 30.0, retry_after=0.5) <= 8.0
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from app.models.task import Task
+from app.models.user import User, UserRole
+from app.services.user_cache import UserCache, UserPrincipal, user_cache
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    Task.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([User(id=1, email="a@example.com", username="a", is_active=True),
+                User(id=2, email="b@example.com", username="b", is_active=True)])
+    db.commit()
+    user_cache._entries.clear()
+    yield db
+    db.close()
+    user_cache._entries.clear()
+
+
+def cache(db, *user_ids):
+    for user_id in user_ids:
+        asyncio.run(user_cache.set(UserPrincipal.from_user(db.get(User, user_id))))
+
+
+def cached(user_id):
+    return asyncio.run(user_cache.get(user_id))
+
+
+def test_principal_round_trips_through_dict():
+    principal = UserPrincipal(id=1, email="a@example.com", username="a", role=UserRole.ADMIN,
+                              is_active=True, is_superuser=False, daily_task_limit=5)
+    restored = UserPrincipal.from_dict(principal.to_dict())
+    assert restored.to_dict() == principal.to_dict()
+    assert restored.role is UserRole.ADMIN
+
+
+def test_cache_expires_and_evicts():
+    local = UserCache(ttl=0, maxsize=2)
+    asyncio.run(local.set(UserPrincipal(id=1)))
+    assert asyncio.run(local.get(1)) is None
+    local = UserCache(ttl=30, maxsize=2)
+    for user_id in (1, 2, 3):
+        asyncio.run(local.set(UserPrincipal(id=user_id)))
+    assert asyncio.run(local.get(1)) is None
+    assert asyncio.run(local.get(3)).id == 3
+
+
+def test_update_invalidates_after_commit_not_at_flush(session):
+    cache(session, 1, 2)
+    session.get(User, 1).is_active = False
+    session.flush()
+    assert cached(1) is not None
+    session.commit()
+    assert cached(1) is None
+    assert cached(2) is not None
+
+
+def test_rolled_back_update_keeps_the_cache(session):
+    cache(session, 1)
+    session.get(User, 1).is_active = False
+    session.flush()
+    session.rollback()
+    assert cached(1) is not None
+    # Nothing left over to invalidate on the next commit
+    session.commit()
+    assert cached(1) is not None
+
+
+def test_delete_invalidates_after_commit(session):
+    cache(session, 1)
+    session.delete(session.get(User, 1))
+    session.commit()
+    assert cached(1) is None
+
+
+def test_bulk_update_invalidates_everything(session):
+    cache(session, 1, 2)
+    session.execute(update(User).where(User.id == 2).values(is_active=False))
+    assert cached(2) is not None
+    session.commit()
+    assert cached(1) is None and cached(2) is None